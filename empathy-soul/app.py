@@ -1,5 +1,10 @@
+import gc
 import os
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, send_from_directory, send_file
+import sys
+import threading
+import time
+from collections import Counter
+from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, send_from_directory, send_file, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_bcrypt import Bcrypt
@@ -9,11 +14,19 @@ from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationE
 from datetime import datetime
 from dotenv import load_dotenv
 from flask_migrate import Migrate
-import requests
-from transformers import BlenderbotTokenizer, BlenderbotForConditionalGeneration
-import torch
-from gtts import gTTS
 import uuid
+from kdc_engine import (
+    PRIORITY_HIGH, PRIORITY_NORMAL, BatchScheduler, CascadeRouter, ConversationStore, ModelLoader, QueueFull, load_draft,
+    load_mmapped, load_quantized, local_checkpoint, max_input_tokens, quantize_dynamic, quantized_cache_path,
+    sse_event, stream_reply
+)
+
+# Shared KDC helpers live at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from kdc_common import (
+    AudioJanitor, InFlightFiles, IntentMatcher, Speech, TTSCache, Transcoder, VisemeTracks, get_backend, get_phonemizer,
+    pending_audio, send_audio
+)
 
 # Load environment variables
 load_dotenv()
@@ -26,6 +39,8 @@ app = Flask(__name__,
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'empathy_soul_secret_key')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URI', 'sqlite:///site.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['AUDIO_SENDFILE_MODE'] = os.getenv('AUDIO_SENDFILE_MODE', '')
+app.config['AUDIO_ACCEL_PREFIX'] = os.getenv('AUDIO_ACCEL_PREFIX', '/protected-audio')
 
 # Initialize extensions
 db = SQLAlchemy(app)
@@ -130,43 +145,395 @@ if not os.path.exists(TEMP_DIR):
     os.makedirs(TEMP_DIR)
 
 # Initialize model and tokenizer for KDC
-model_name = "facebook/blenderbot-400M-distill"  # A smaller, faster model
-try:
-    kdc_tokenizer = BlenderbotTokenizer.from_pretrained(model_name)
-    kdc_model = BlenderbotForConditionalGeneration.from_pretrained(model_name)
-except Exception as e:
-    print(f"Error loading KDC model: {e}")
-    kdc_tokenizer = None
-    kdc_model = None
-
-def generate_response(user_input):
-    """Generate a text response using the BlenderBot model"""
-    if kdc_tokenizer is None or kdc_model is None:
-        return "I'm sorry, my language model is currently unavailable. Please try again later."
+model_name = os.getenv('KDC_MODEL_NAME', "facebook/blenderbot-400M-distill")  # A smaller, faster model
+
+# Weights are converted once to a local safetensors file and memory-mapped, so
+# processes on one host share them through the page cache
+KDC_MMAP_WEIGHTS = os.getenv('KDC_MMAP_WEIGHTS', '1') == '1'
+KDC_MODEL_CACHE = os.getenv('KDC_MODEL_CACHE', 'model_cache')
+
+# "int8" swaps the Linear layers for dynamically quantized ones (CPU only);
+# the quantized model is cached next to the checkpoint
+KDC_QUANTIZE = os.getenv('KDC_QUANTIZE', '')
+
+# "onnx" runs generation on ONNX Runtime (exported once into the model cache)
+# with greedy or sampled decoding instead of torch beam search
+KDC_BACKEND = os.getenv('KDC_BACKEND', 'torch')
+
+# Assisted decoding: a draft model proposes tokens and BlenderBot verifies them
+# in one forward pass. "layers:N" drafts with the first N decoder layers of the
+# main model (shares its weights); anything else is a model with the same
+# vocabulary. Decoding becomes greedy, the only mode assisted generation supports
+KDC_DRAFT_MODEL = os.getenv('KDC_DRAFT_MODEL', '')
+kdc_draft_model = None
+
+def load_kdc_model():
+    """Load the BlenderBot tokenizer and weights (runs on the loader thread)"""
+    # torch and transformers take seconds to import; only the loader needs them
+    from transformers import BlenderbotTokenizer, BlenderbotForConditionalGeneration
     
-    # Tokenize input and generate response
-    inputs = kdc_tokenizer([user_input], return_tensors="pt", truncation=True, max_length=512)
-    reply_ids = kdc_model.generate(
-        **inputs,
+    if KDC_MMAP_WEIGHTS:
+        checkpoint = local_checkpoint(model_name, KDC_MODEL_CACHE, BlenderbotForConditionalGeneration, BlenderbotTokenizer)
+    else:
+        checkpoint = model_name
+    tokenizer = BlenderbotTokenizer.from_pretrained(checkpoint)
+    # Over-long conversation context loses its oldest turns, never the new message
+    # (inputs are cut to the encoder's positions, see max_input_tokens)
+    tokenizer.truncation_side = 'left'
+    
+    def load_weights():
+        if KDC_MMAP_WEIGHTS:
+            try:
+                return load_mmapped(BlenderbotForConditionalGeneration, checkpoint)
+            except Exception as e:
+                app.logger.warning(f"Memory-mapped load failed ({e}); loading {checkpoint} into memory")
+        model = BlenderbotForConditionalGeneration.from_pretrained(checkpoint, low_cpu_mem_usage=True)
+        model.eval()
+        return model
+    
+    if KDC_BACKEND == 'onnx':
+        # Pulls in numpy and onnxruntime, so only imported when selected
+        from kdc_engine.onnx_backend import load_onnx
+        onnx_dir = os.path.join(KDC_MODEL_CACHE, model_name.strip('/').replace('/', '--') + '--onnx')
+        model = load_onnx(onnx_dir, load_weights, threads=int(os.getenv('KDC_ORT_THREADS', '0')))
+    elif KDC_QUANTIZE == 'int8':
+        model = load_quantized(quantized_cache_path(KDC_MODEL_CACHE, model_name), load_weights)
+    else:
+        model = load_weights()
+    
+    global kdc_draft_model
+    if KDC_DRAFT_MODEL and KDC_BACKEND == 'torch':
+        try:
+            kdc_draft_model = load_draft(KDC_DRAFT_MODEL, model, load_draft_weights)
+            app.logger.info(f"Assisted decoding enabled with draft {KDC_DRAFT_MODEL}")
+        except Exception as e:
+            app.logger.warning(f"Could not load draft model {KDC_DRAFT_MODEL} ({e}); decoding without it")
+    elif KDC_DRAFT_MODEL:
+        app.logger.warning(f"Assisted decoding is only available on the torch backend, not {KDC_BACKEND}")
+    
+    # History beyond the encoder would only be truncated away, mid-turn
+    limit = max_input_tokens(model, tokenizer) - 1
+    if conversations.token_budget > limit:
+        app.logger.warning(f"KDC_CONTEXT_TOKENS={conversations.token_budget} exceeds the encoder; using {limit}")
+        conversations.token_budget = limit
+    return tokenizer, model
+
+def load_draft_weights(name):
+    """Load a separate draft model, quantized like the main one"""
+    from transformers import AutoModelForSeq2SeqLM
+    
+    draft = AutoModelForSeq2SeqLM.from_pretrained(name, low_cpu_mem_usage=True)
+    if KDC_QUANTIZE == 'int8':
+        draft = quantize_dynamic(draft)
+    return draft
+
+# Weights load in the background so page routes are served right after boot;
+# CLI commands such as `flask db upgrade` never serve a request and never load them
+kdc_loader = ModelLoader(load_kdc_model, name=model_name)
+
+@app.before_request
+def start_background_work():
+    # Started on first request rather than at import so a pre-fork master
+    # (see gunicorn.conf.py) never forks with these threads running
+    kdc_loader.start()
+    audio_janitor.start()
+    viseme_janitor.start()
+
+def generation_kwargs(tokenizer):
+    """Decoding settings shared by the batched and streamed generate paths"""
+    kwargs = dict(
         max_length=128,
         num_return_sequences=1,
         temperature=0.7,
-        pad_token_id=kdc_tokenizer.eos_token_id,
+        pad_token_id=tokenizer.eos_token_id,
         no_repeat_ngram_size=3
     )
-    response = kdc_tokenizer.batch_decode(reply_ids, skip_special_tokens=True)[0]
-    return response
+    if KDC_DRAFT_MODEL:
+        # Every path decodes the same way, assisted or not
+        kwargs.update(num_beams=1, do_sample=False)
+    return kwargs
 
-def text_to_speech(text):
-    """Convert text to speech and save as an audio file"""
-    # Generate unique filename
-    audio_file = os.path.join(TEMP_DIR, f"{str(uuid.uuid4())}.mp3")
+# Fast tokenizers keep padding/truncation settings on the shared Rust object,
+# so concurrent encodes from request, batch and stream threads must not overlap
+tokenizer_lock = threading.Lock()
+
+def generate_batch(user_inputs, max_time=None):
+    """Generate one BlenderBot reply per input with a single padded generate call.
+    
+    Replies cut short by ``max_time`` come back as None.
+    """
+    import torch
+    
+    kdc_tokenizer, kdc_model = kdc_loader.value
+    with tokenizer_lock:
+        # One over-long message must not overflow the position table and fail its whole batch
+        inputs = kdc_tokenizer(user_inputs, return_tensors="pt", padding=True, truncation=True,
+                               max_length=max_input_tokens(kdc_model, kdc_tokenizer))
+    kwargs = generation_kwargs(kdc_tokenizer)
+    if kdc_draft_model is not None and len(user_inputs) == 1:
+        # Assisted generation handles one sequence at a time; under load the
+        # batcher's larger batches give the throughput instead
+        kwargs['assistant_model'] = kdc_draft_model
+    if max_time is not None:
+        kwargs['max_time'] = max(max_time, 0.0)
+    started = time.monotonic()
+    with torch.no_grad():
+        reply_ids = kdc_model.generate(**inputs, **kwargs)
+    replies = kdc_tokenizer.batch_decode(reply_ids, skip_special_tokens=True)
     
-    # Generate speech
-    tts = gTTS(text=text, lang='en')
-    tts.save(audio_file)
+    if max_time is not None and time.monotonic() - started >= max_time:
+        # Rows that never produced an end-of-sequence token were stopped by max_time
+        eos = kdc_tokenizer.eos_token_id
+        replies = [reply if eos in row[1:] else None for reply, row in zip(replies, reply_ids.tolist())]
+    return replies
+
+# Requests arriving within the batch window share one generate call
+kdc_batcher = BatchScheduler(
+    generate_batch,
+    max_batch_size=int(os.getenv('KDC_BATCH_MAX_SIZE', '8')),
+    max_wait_ms=float(os.getenv('KDC_BATCH_WINDOW_MS', '20')),
+    # Beyond this many queued requests new chat is shed with 503 + Retry-After
+    max_queue=int(os.getenv('KDC_MAX_QUEUE', '32'))
+)
+
+# Streams generate outside the batcher, so they get their own cap
+KDC_MAX_STREAMS = int(os.getenv('KDC_MAX_STREAMS', '4'))
+stream_slots = threading.BoundedSemaphore(KDC_MAX_STREAMS)
+
+# Messages showing crisis or acute distress skip ahead of casual chat
+# and are only shed when the queue is twice its normal limit
+crisis_matcher = IntentMatcher([
+    ('crisis', [
+        "suicid*", "kill myself", "end my life", "end it all", "want to die", "self-harm*", "hurt myself",
+        "hurting myself", "overdos*", "can't go on", "no reason to live", "hopeless", "panic attack*"
+    ]),
+])
+
+def chat_priority(message):
+    return PRIORITY_HIGH if crisis_matcher.first(message) else PRIORITY_NORMAL
+
+def count_tokens(text):
+    kdc_tokenizer, _ = kdc_loader.value
+    with tokenizer_lock:
+        return len(kdc_tokenizer.tokenize(text))
+
+# Recent turns per logged-in user, trimmed to what fits in the encoder
+conversations = ConversationStore(
+    count_tokens,
+    token_budget=int(os.getenv('KDC_CONTEXT_TOKENS', '120')),
+    max_turns=int(os.getenv('KDC_CONTEXT_TURNS', '16')),
+    max_sessions=int(os.getenv('KDC_MAX_SESSIONS', '1000')),
+    idle_seconds=float(os.getenv('KDC_SESSION_IDLE_SECONDS', '1800'))
+)
+
+# Mood terms, highest priority first; "unhappy" no longer reads as "happy"
+mood_matcher = IntentMatcher([
+    ('sad', ['sad', 'depressed', 'unhappy']),
+    ('happy', ['happy', 'good', 'great']),
+    ('anxious', ['anxious', 'nervous', 'worried']),
+    ('angry', ['angry', 'mad', 'frustrated']),
+])
+
+MOOD_RESPONSES = {
+    'sad': "I'm sorry to hear you're feeling down. Remember that it's okay to have these feelings, and they're a normal part of life. Would you like to talk more about what's causing these feelings?",
+    'happy': "I'm glad to hear you're feeling positive! It's wonderful that you're experiencing these good emotions. What's contributing to your happiness today?",
+    'anxious': "Feeling anxious can be challenging. Taking deep breaths might help in the moment. Would you like to explore what's causing this anxiety?",
+    'angry': "I understand that anger and frustration can be intense. These emotions often have important messages for us. What do you think triggered these feelings?",
+}
+
+def keyword_response(message):
+    """Pick a canned supportive reply from simple keyword rules"""
+    default = "I'm your Empathy Soul companion. While I'm not fully connected to an AI model right now, I'm here to listen and support you. Could you tell me more about how you're feeling today?"
+    return MOOD_RESPONSES.get(mood_matcher.first(message), default)
+
+# Routine messages the cascade answers without the model, highest priority
+# first. Intents without replies are filler that only adds to the confidence
+routine_matcher = IntentMatcher([
+    ('check_in', ["how are you", "how are you doing", "how's it going", "how have you been", "what's up", "sup"]),
+    ('greeting', ["hi", "hello", "hey", "hiya", "yo", "greetings", "good morning", "good afternoon",
+                  "good evening"]),
+    ('thanks', ["thanks", "thank you", "thx", "ty", "appreciate it"]),
+    ('farewell', ["bye", "goodbye", "good night", "see you", "see ya", "talk later", "talk to you later",
+                  "take care", "gotta go"]),
+    ('acknowledgement', ["ok", "okay", "cool", "alright", "got it", "sure", "nice"]),
+    ('filler', ["there", "so", "much", "very", "a lot", "again", "today", "tonight", "doing", "you", "too", "and",
+                "just", "well", "oh", "please", "friend", "buddy", "kdc"]),
+])
+
+ROUTINE_REPLIES = {
+    'check_in': [
+        "I'm doing well, thank you for asking! How are you feeling today?",
+        "I'm here and glad to chat. How has your day been so far?",
+    ],
+    'greeting': [
+        "Hello! It's good to see you. How are you feeling today?",
+        "Hi there! I'm here to listen. What's on your mind?",
+    ],
+    'thanks': [
+        "You're very welcome. I'm always here if you want to talk.",
+        "Anytime! Is there anything else on your mind?",
+    ],
+    'farewell': [
+        "Take care of yourself. I'm here whenever you want to talk again.",
+        "Goodbye for now, and be gentle with yourself today.",
+    ],
+    'acknowledgement': [
+        "I'm glad. Is there anything else you'd like to talk about?",
+        "Alright. I'm here whenever you want to share more.",
+    ],
+}
+
+# Canned replies when at least this share of a short message is routine;
+# everything else (and every crisis message) goes to the model.
+# KDC_ROUTER_CONFIDENCE above 1 sends all traffic to the model
+reply_router = CascadeRouter(
+    routine_matcher,
+    ROUTINE_REPLIES,
+    threshold=float(os.getenv('KDC_ROUTER_CONFIDENCE', '0.75')),
+    max_words=int(os.getenv('KDC_ROUTER_MAX_WORDS', '8'))
+)
+
+# Hard ceiling on how long a chat request may spend on the model; past it the
+# keyword reply is served instead
+KDC_DEADLINE_SECONDS = float(os.getenv('KDC_DEADLINE_SECONDS', '8'))
+
+# Which path served each reply: "canned" (routine message), "model",
+# "keyword" (model not ready),
+# "deadline_fallback" (budget blown) or "model_truncated" (stream cut short)
+response_paths = Counter()
+response_paths_lock = threading.Lock()
+
+# Router tier of each path the canned tier passed on to ("shed" served nothing)
+ROUTER_TIERS = {
+    'model': 'model', 'model_truncated': 'model', 'keyword': 'fallback', 'deadline_fallback': 'fallback'
+}
+
+def count_path(path):
+    with response_paths_lock:
+        response_paths[path] += 1
+    if path in ROUTER_TIERS:
+        reply_router.record(ROUTER_TIERS[path])
+    return path
+
+def path_counts():
+    with response_paths_lock:
+        return dict(response_paths)
+
+def overloaded(retry_after):
+    """503 telling the client to come back once the inference queue drains"""
+    count_path('shed')
+    response = jsonify({'error': 'The companion is busy right now, please try again shortly', 'path': 'shed'})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 503
+
+def latency_budget(data):
+    """Seconds this request may spend on the model; clients may ask for less"""
+    budget = KDC_DEADLINE_SECONDS
+    requested = data.get('latency_budget_ms')
+    if requested:
+        budget = min(budget, max(0.1, float(requested) / 1000.0))
+    return budget
+
+def canned_reply(user_input, session_id=None, priority=PRIORITY_NORMAL):
+    """Answer a routine message from the cascade's canned tier, or return None"""
+    reply = reply_router.route(user_input, allow_canned=priority != PRIORITY_HIGH)
+    # Like keyword replies, nothing is recorded before the tokenizer is loaded
+    if reply is not None and session_id is not None and kdc_loader.ready:
+        # Kept in the history so the model sees the whole conversation
+        conversations.record(session_id, user_input, reply)
+    return reply
+
+def generate_response(user_input, session_id=None, budget=None, priority=PRIORITY_NORMAL):
+    """Reply through the cascade: canned replies for routine messages, then BlenderBot.
     
-    return audio_file
+    Returns ``(text, path)`` where path names what produced the text; raises
+    ``QueueFull`` when the request is shed.
+    """
+    reply = canned_reply(user_input, session_id, priority)
+    if reply is not None:
+        return reply, count_path('canned')
+    
+    if not kdc_loader.ready:
+        # Model still loading (or failed to load): answer from the keyword rules
+        return keyword_response(user_input), count_path('keyword')
+    
+    # Earlier turns of the user's conversation give the model context
+    context = user_input if session_id is None else conversations.context_for(session_id, user_input)
+    try:
+        reply = kdc_batcher.submit(context, timeout=budget, priority=priority)
+    except TimeoutError:
+        reply = None
+    if reply is None:
+        return keyword_response(user_input), count_path('deadline_fallback')
+    
+    if session_id is not None:
+        conversations.record(session_id, user_input, reply)
+    return reply, count_path('model')
+
+# Text-to-speech engine: "gtts" (default, online), "espeak" or "pyttsx3" (offline)
+tts_backend = get_backend(os.getenv('TTS_BACKEND', 'gtts'), os.getenv('TTS_VOICE') or None)
+TTS_VOICE = tts_backend.voice_id
+
+# Split replies into sentences rendered in parallel so playback can start early
+TTS_CHUNKED = os.getenv('TTS_CHUNKED', '0') == '1'
+
+def synthesize_speech(text, lang, voice, path):
+    """Render speech with the configured backend (``voice`` is only the cache key)"""
+    tts_backend.synthesize(text, lang, path)
+
+audio_in_flight = InFlightFiles()
+
+# Keep temp_audio within an age and size budget instead of growing until /cleanup
+audio_janitor = AudioJanitor(
+    TEMP_DIR,
+    audio_in_flight,
+    max_age=float(os.getenv('TEMP_AUDIO_MAX_AGE_SECONDS', '3600')),
+    max_bytes=int(os.getenv('TEMP_AUDIO_MAX_MB', '100')) * 1024 * 1024,
+    interval=float(os.getenv('TEMP_AUDIO_SWEEP_SECONDS', '60'))
+)
+
+# Identical replies share one content-addressed audio file
+tts_cache = TTSCache(
+    os.getenv('TTS_CACHE_DIR', 'tts_cache'),
+    synthesize_speech,
+    max_bytes=int(os.getenv('TTS_CACHE_MAX_MB', '256')) * 1024 * 1024,
+    in_flight=audio_in_flight,
+    extension=tts_backend.extension
+)
+
+# Low-bitrate variants (?profile=opus24|mp3-48), encoded once per reply
+transcoder = Transcoder(
+    os.path.join(tts_cache.cache_dir, 'variants'),
+    max_bytes=int(os.getenv('AUDIO_VARIANTS_MAX_MB', '64')) * 1024 * 1024,
+    in_flight=audio_in_flight
+)
+
+# Lip-sync timelines for the avatar, computed once per audio file (from espeak phonemes if installed)
+viseme_tracks = VisemeTracks(os.path.join(tts_cache.cache_dir, 'visemes'), phonemize=get_phonemizer(tts_backend))
+viseme_janitor = AudioJanitor(
+    viseme_tracks.directory,
+    audio_in_flight,
+    max_age=float(os.getenv('VISEME_MAX_AGE_SECONDS', str(7 * 24 * 3600))),
+    max_bytes=int(os.getenv('VISEME_MAX_MB', '16')) * 1024 * 1024,
+    interval=3600
+)
+
+# Speech is rendered on a bounded pool so chat replies are not held back by TTS
+speech = Speech(
+    tts_cache,
+    viseme_tracks,
+    TTS_VOICE,
+    workers=int(os.getenv('TTS_WORKERS', '4')),
+    wait_seconds=float(os.getenv('AUDIO_WAIT_SECONDS', '15')),
+    fallback_dir=TEMP_DIR,
+    mimetype=tts_backend.mimetype
+)
+audio_jobs = speech.jobs
+
+def speech_payload(text, chunked):
+    """Schedule speech for a reply and describe where its audio will be served"""
+    audio_filenames = speech.schedule_chunks(text) if chunked else [speech.schedule(text)]
+    return speech.payload(audio_filenames, '/kdc-api', chunked)
 
 # KDC API Routes
 @app.route('/kdc-api/chat', methods=['POST'])
@@ -180,40 +547,174 @@ def kdc_chat():
             return jsonify({'error': 'No message provided'}), 400
         
         # Generate text response
-        response_text = generate_response(user_message)
-        
-        # Generate speech
-        audio_file = text_to_speech(response_text)
+        try:
+            response_text, path = generate_response(
+                user_message, current_user.id, latency_budget(data), chat_priority(user_message)
+            )
+        except QueueFull as e:
+            return overloaded(e.retry_after)
         
+        # Speech is generated in the background; the audio URL resolves once ready
         return jsonify({
             'text': response_text,
-            'audio_url': f'/kdc-api/audio/{os.path.basename(audio_file)}'
+            'path': path,
+            **speech_payload(response_text, data.get('chunked', TTS_CHUNKED))
         })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/kdc-api/chat/stream', methods=['POST'])
+@login_required
+def kdc_chat_stream():
+    """Stream the reply as server-sent events: one ``token`` event per decoded
+    chunk, then a ``done`` event carrying the full text and audio URL"""
+    data = request.json or {}
+    user_message = data.get('message', '')
+    
+    if not user_message:
+        return jsonify({'error': 'No message provided'}), 400
+    
+    session_id = current_user.id
+    budget = latency_budget(data)
+    priority = chat_priority(user_message)
+    canned = canned_reply(user_message, session_id, priority)
+    # Crisis messages are always admitted; everything else needs a free slot
+    holds_slot = canned is None and priority != PRIORITY_HIGH and kdc_loader.ready
+    if holds_slot and not stream_slots.acquire(blocking=False):
+        return overloaded(1)
+    
+    def events():
+        try:
+            if canned is not None:
+                response_text, path = canned, count_path('canned')
+                chunks = [response_text]
+                yield sse_event('token', {'text': response_text})
+            elif not kdc_loader.ready:
+                response_text, path = keyword_response(user_message), count_path('keyword')
+                chunks = [response_text]
+                yield sse_event('token', {'text': response_text})
+            else:
+                kdc_tokenizer, kdc_model = kdc_loader.value
+                context = conversations.context_for(session_id, user_message)
+                started = time.monotonic()
+                chunks = []
+                for chunk in stream_reply(kdc_model, kdc_tokenizer, context, max_time=budget,
+                                          tokenizer_lock=tokenizer_lock,
+                                          **generation_kwargs(kdc_tokenizer)):
+                    chunks.append(chunk)
+                    yield sse_event('token', {'text': chunk})
+                
+                if time.monotonic() - started < budget:
+                    path = count_path('model')
+                elif chunks:
+                    # Tokens already sent cannot be taken back; keep the partial reply
+                    path = count_path('model_truncated')
+                else:
+                    path = count_path('deadline_fallback')
+                    chunks = [keyword_response(user_message)]
+                    yield sse_event('token', {'text': chunks[0]})
+                if path != 'deadline_fallback':
+                    conversations.record(session_id, user_message, ''.join(chunks).strip())
+            
+            response_text = ''.join(chunks).strip()
+            yield sse_event('done', {
+                'text': response_text,
+                'path': path,
+                **speech_payload(response_text, data.get('chunked', TTS_CHUNKED))
+            })
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+    
+    response = Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    if holds_slot:
+        # Runs even if the client disconnects before the stream starts
+        response.call_on_close(stream_slots.release)
+    return response
+
 @app.route('/kdc-api/audio/<filename>')
 @login_required
 def kdc_audio(filename):
     try:
-        return send_file(
-            os.path.join(TEMP_DIR, filename),
-            mimetype='audio/mp3'
-        )
+        pending = pending_audio(speech, filename)
+        if pending:
+            return pending
+        
+        audio_path, content_key, mimetype = speech.resolve(filename)
+        if content_key:
+            # Cached files are content-addressed and can be cached by the browser
+            audio_path, content_key, mimetype = transcoder.negotiate(
+                audio_path, content_key, mimetype, request.args.get('profile')
+            )
+            return send_audio(audio_path, audio_in_flight, mimetype, content_key=content_key)
+        return send_audio(audio_path, audio_in_flight, mimetype)
     except Exception as e:
         return jsonify({'error': str(e)}), 404
 
+@app.route('/kdc-api/lipsync/<filename>')
+@login_required
+def kdc_lipsync(filename):
+    try:
+        pending = pending_audio(speech, filename)
+        if pending:
+            return pending
+        
+        track = viseme_tracks.load(filename)
+        if track is None:
+            return jsonify({'error': 'No lip-sync track for this audio'}), 404
+        return jsonify(track)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: the KDC model is loaded and chat replies come from it"""
+    status = kdc_loader.status()
+    return jsonify(status), 200 if kdc_loader.ready else 503
+
+@app.route('/kdc-api/metrics')
+@login_required
+def kdc_metrics():
+    """Expose inference metrics for throughput/latency tuning"""
+    return jsonify({
+        'model': dict(kdc_loader.status(), backend=KDC_BACKEND, quantization=KDC_QUANTIZE or 'fp32',
+                      draft=KDC_DRAFT_MODEL if kdc_draft_model is not None else None),
+        'batching': kdc_batcher.metrics(),
+        'conversations': conversations.stats(),
+        'deadline_seconds': KDC_DEADLINE_SECONDS,
+        'response_paths': path_counts(),
+        'router': reply_router.stats(),
+        'tts_backend': TTS_VOICE,
+        'tts_cache': tts_cache.stats(),
+        'audio_jobs': audio_jobs.stats(),
+        'temp_audio': audio_janitor.stats(),
+        'audio_variants': transcoder.stats()
+    })
+
+@app.route('/kdc-api/chat/reset', methods=['POST'])
+@login_required
+def kdc_chat_reset():
+    """Forget the conversation so far; the next message starts a new one"""
+    conversations.reset(current_user.id)
+    return jsonify({'status': 'ok'})
+
 # Cleanup old audio files
 @app.route('/kdc-api/cleanup', methods=['POST'])
 @login_required
 def kdc_cleanup():
     try:
-        for file in os.listdir(TEMP_DIR):
-            file_path = os.path.join(TEMP_DIR, file)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
-        return jsonify({'message': 'Cleanup successful'})
+        # Sweep expired files now; anything still being downloaded is kept
+        count = audio_janitor.sweep()
+        return jsonify({'message': f'Cleanup successful, removed {count} files'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -277,6 +778,7 @@ def login():
 @app.route('/logout')
 @login_required
 def logout():
+    conversations.reset(current_user.id)
     logout_user()
     flash('You have been logged out successfully', 'info')
     return redirect(url_for('home'))
@@ -297,22 +799,10 @@ def chatbot_message():
     data = request.json
     message = data.get('message', '')
     
-    # In a real app, you would integrate with a language model API here
-    # For now, we'll use a simple response system
-    
-    response = "I'm your Empathy Soul companion. While I'm not fully connected to an AI model right now, I'm here to listen and support you. Could you tell me more about how you're feeling today?"
-    
-    if "sad" in message.lower() or "depressed" in message.lower() or "unhappy" in message.lower():
-        response = "I'm sorry to hear you're feeling down. Remember that it's okay to have these feelings, and they're a normal part of life. Would you like to talk more about what's causing these feelings?"
-    
-    elif "happy" in message.lower() or "good" in message.lower() or "great" in message.lower():
-        response = "I'm glad to hear you're feeling positive! It's wonderful that you're experiencing these good emotions. What's contributing to your happiness today?"
-    
-    elif "anxious" in message.lower() or "nervous" in message.lower() or "worried" in message.lower():
-        response = "Feeling anxious can be challenging. Taking deep breaths might help in the moment. Would you like to explore what's causing this anxiety?"
-    
-    elif "angry" in message.lower() or "mad" in message.lower() or "frustrated" in message.lower():
-        response = "I understand that anger and frustration can be intense. These emotions often have important messages for us. What do you think triggered these feelings?"
+    response = canned_reply(message, priority=chat_priority(message))
+    if response is None:
+        response = keyword_response(message)
+        reply_router.record('fallback')
     
     return jsonify({
         'response': response,
@@ -528,5 +1018,28 @@ with app.app_context():
     db.create_all()
     create_default_user()
 
+def init_app(preload_model=False):
+    """Prepare the module's app for serving and return it.
+
+    With preload_model the BlenderBot weights are loaded before returning, so a
+    pre-fork server loads them once in its master process and the forked
+    workers share them copy-on-write (see gunicorn.conf.py and wsgi.py).
+    """
+    with app.app_context():
+        # Forked workers must not share the master's database connections
+        db.engine.dispose()
+    
+    if preload_model:
+        kdc_loader.load_now()
+        # Keep the garbage collector from writing to (and so copying) the
+        # preloaded objects when it runs in the workers
+        gc.freeze()
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
+    # Development server; in production run `gunicorn -c gunicorn.conf.py wsgi:application`
+    debug = os.getenv('FLASK_DEBUG', '1') == '1'
+    # With the reloader on, only its child process serves requests and needs the model
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        kdc_loader.start()
+    init_app().run(debug=debug, port=5001)
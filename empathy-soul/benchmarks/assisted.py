@@ -0,0 +1,92 @@
+"""Compare assisted (speculative) decoding against plain generation.
+
+Usage:
+    python benchmarks/assisted.py [--draft layers:4] [--runs 3] [--prompts prompts.txt] [--min-match 1.0]
+
+Loads the model through ``load_kdc_model`` with ``KDC_DRAFT_MODEL`` set to
+``--draft`` and decodes a fixed prompt set twice with the app's generation
+settings: once with plain greedy ``generate`` and once with the draft as the
+assistant model. Reports tokens per second for both, the speedup, and how
+many replies are token-for-token identical. Assisted decoding only changes
+how fast tokens are found, so anything below a full match is a bug; the
+script exits non-zero when the match rate is below ``--min-match``.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.quantization import load_prompts
+
+
+def decode(app, tokenizer, model, prompts, runs, assistant=None):
+    """Return (token id lists, per-prompt median tokens/sec)"""
+    import torch
+
+    kwargs = app.generation_kwargs(tokenizer)
+    if assistant is not None:
+        kwargs['assistant_model'] = assistant
+    sequences = []
+    rates = []
+    for prompt in prompts:
+        inputs = tokenizer([prompt], return_tensors="pt", truncation=True,
+                           max_length=app.max_input_tokens(model, tokenizer))
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            with torch.no_grad():
+                reply_ids = model.generate(**inputs, **kwargs)
+            # The decoder start token is not generated
+            samples.append((reply_ids.shape[1] - 1) / (time.perf_counter() - started))
+        sequences.append([int(token) for token in reply_ids[0]])
+        rates.append(statistics.median(samples))
+    return sequences, rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--draft', default='layers:4', help="Draft model: layers:N or a model name/path")
+    parser.add_argument('--runs', type=int, default=3, help="Timed generations per prompt")
+    parser.add_argument('--prompts', help="File with one prompt per line (defaults to a built-in set)")
+    parser.add_argument('--min-match', type=float, default=1.0, help="Required share of identical replies")
+    parser.add_argument('--show', action='store_true', help="Print replies that differ")
+    args = parser.parse_args()
+    prompts = load_prompts(args.prompts)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ.setdefault('DATABASE_URI', f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+        import app
+
+        app.KDC_DRAFT_MODEL = args.draft
+        tokenizer, model = app.load_kdc_model()
+        if app.kdc_draft_model is None:
+            raise SystemExit(f"Draft model {args.draft} could not be loaded")
+        plain_ids, plain_rates = decode(app, tokenizer, model, prompts, args.runs)
+        assisted_ids, assisted_rates = decode(app, tokenizer, model, prompts, args.runs, app.kdc_draft_model)
+
+    matches = sum(1 for a, b in zip(plain_ids, assisted_ids) if a == b)
+    if args.show:
+        for prompt, a, b in zip(prompts, plain_ids, assisted_ids):
+            if a != b:
+                print(f"> {prompt}\n  plain:    {tokenizer.decode(a, skip_special_tokens=True)}\n"
+                      f"  assisted: {tokenizer.decode(b, skip_special_tokens=True)}\n")
+
+    print(f"{'mode':<9} {'median tok/s':>13} {'p10 tok/s':>10}")
+    for label, rates in (('plain', plain_rates), ('assisted', assisted_rates)):
+        p10 = sorted(rates)[int(0.1 * (len(rates) - 1))]
+        print(f"{label:<9} {statistics.median(rates):13.1f} {p10:10.1f}")
+    print()
+    print(f"draft:             {args.draft}")
+    print(f"identical replies: {matches}/{len(prompts)}")
+    print(f"speedup:           {statistics.median(assisted_rates) / statistics.median(plain_rates):.2f}x")
+
+    if matches < args.min_match * len(prompts):
+        raise SystemExit(f"Assisted output diverged from plain generate on {len(prompts) - matches} prompts")
+
+
+if __name__ == '__main__':
+    main()
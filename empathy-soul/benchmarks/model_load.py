@@ -0,0 +1,82 @@
+"""Compare in-memory and memory-mapped loading of the KDC model.
+
+Usage:
+    python benchmarks/model_load.py [--runs 3]
+
+Each run loads the model in a fresh interpreter through ``load_kdc_model``,
+once with ``KDC_MMAP_WEIGHTS=0`` (plain ``from_pretrained``) and once with the
+memory-mapped safetensors checkpoint, and reports the load time along with
+how much of the process memory is anonymous (private to the process) versus
+file-backed (shared through the page cache). The local checkpoint is built
+before timing starts, so the first conversion is not counted.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import json, time
+import app
+
+def memory_kb():
+    fields = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('RssAnon', 'RssFile'):
+                fields[key] = int(value.split()[0])
+    return fields
+
+# Import the model code up front so only the weight loading is measured
+from transformers import BlenderbotTokenizer, BlenderbotForConditionalGeneration
+before = memory_kb()
+started = time.perf_counter()
+app.load_kdc_model()
+elapsed = time.perf_counter() - started
+after = memory_kb()
+print(json.dumps({
+    'seconds': elapsed,
+    'anon_mb': (after.get('RssAnon', 0) - before.get('RssAnon', 0)) / 1024,
+    'file_mb': (after.get('RssFile', 0) - before.get('RssFile', 0)) / 1024,
+}))
+'''
+
+
+def run_probe(mmap_weights, workdir):
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URI', f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    env.setdefault('KDC_MODEL_CACHE', os.path.join(APP_DIR, 'model_cache'))
+    env['KDC_MMAP_WEIGHTS'] = '1' if mmap_weights else '0'
+    env['PYTHONPATH'] = APP_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=workdir, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr[-2000:], file=sys.stderr)
+        raise SystemExit("Probe process failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help="Fresh interpreters per mode")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Build the local safetensors checkpoint outside the timed runs
+        run_probe(True, workdir)
+
+        print(f"{'mode':<10} {'load s':>8} {'anon MB':>9} {'file MB':>9}")
+        for label, mmap_weights in (('in-memory', False), ('mmap', True)):
+            samples = [run_probe(mmap_weights, workdir) for _ in range(args.runs)]
+            print(f"{label:<10} {statistics.median(s['seconds'] for s in samples):8.2f} "
+                  f"{statistics.median(s['anon_mb'] for s in samples):9.1f} "
+                  f"{statistics.median(s['file_mb'] for s in samples):9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Check the ONNX Runtime backend against the torch model.
+
+Usage:
+    python benchmarks/onnx_parity.py [--runs 3] [--prompts prompts.txt] [--min-match 1.0]
+
+Loads the model through ``load_kdc_model`` with ``KDC_BACKEND=torch`` and
+``KDC_BACKEND=onnx`` (exporting it on first use) and decodes a fixed prompt
+set greedily with the app's generation settings, since that is the decoding
+both backends share. Reports how many replies are token-for-token identical
+and the latency of each backend, and exits non-zero when the match rate is
+below ``--min-match``.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.quantization import PROMPTS, load_prompts
+
+
+def decode(app, tokenizer, model, prompts, runs):
+    """Return (token id lists, per-prompt median seconds) for greedy decoding"""
+    import torch
+
+    kwargs = dict(app.generation_kwargs(tokenizer), num_beams=1, do_sample=False)
+    sequences = []
+    latencies = []
+    for prompt in prompts:
+        inputs = tokenizer([prompt], return_tensors="pt", truncation=True,
+                           max_length=app.max_input_tokens(model, tokenizer))
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            with torch.no_grad():
+                reply_ids = model.generate(**inputs, **kwargs)
+            samples.append(time.perf_counter() - started)
+        sequences.append([int(token) for token in reply_ids[0]])
+        latencies.append(statistics.median(samples))
+    return sequences, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help="Timed generations per prompt")
+    parser.add_argument('--prompts', help="File with one prompt per line (defaults to a built-in set)")
+    parser.add_argument('--min-match', type=float, default=1.0, help="Required share of identical replies")
+    parser.add_argument('--show', action='store_true', help="Print replies that differ")
+    args = parser.parse_args()
+    prompts = load_prompts(args.prompts)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ.setdefault('DATABASE_URI', f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+        import app
+
+        results = {}
+        for backend in ('torch', 'onnx'):
+            app.KDC_BACKEND = backend
+            tokenizer, model = app.load_kdc_model()
+            results[backend] = decode(app, tokenizer, model, prompts, args.runs)
+            del model
+
+    torch_ids, torch_latencies = results['torch']
+    onnx_ids, onnx_latencies = results['onnx']
+    matches = sum(1 for a, b in zip(torch_ids, onnx_ids) if a == b)
+    if args.show:
+        for prompt, a, b in zip(prompts, torch_ids, onnx_ids):
+            if a != b:
+                print(f"> {prompt}\n  torch: {tokenizer.decode(a, skip_special_tokens=True)}\n"
+                      f"  onnx:  {tokenizer.decode(b, skip_special_tokens=True)}\n")
+
+    print(f"{'backend':<8} {'median s':>9} {'p90 s':>8}")
+    for label, latencies in (('torch', torch_latencies), ('onnx', onnx_latencies)):
+        p90 = sorted(latencies)[int(0.9 * (len(latencies) - 1))]
+        print(f"{label:<8} {statistics.median(latencies):9.3f} {p90:8.3f}")
+    print()
+    print(f"identical replies: {matches}/{len(prompts)}")
+    print(f"speedup:           {statistics.median(torch_latencies) / statistics.median(onnx_latencies):.2f}x")
+
+    if matches < args.min_match * len(prompts):
+        raise SystemExit(f"ONNX output diverged from torch on {len(prompts) - matches} prompts")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Compare int8 dynamic quantization against the fp32 KDC model.
+
+Usage:
+    python benchmarks/quantization.py [--runs 3] [--prompts prompts.txt]
+
+Loads the model twice through ``load_kdc_model`` (fp32, then with
+``KDC_QUANTIZE=int8``) and generates replies for a fixed prompt set with the
+same decoding settings as ``generate_response``. Reports per-reply latency,
+the speedup, and how close the int8 replies are to the fp32 ones (exact
+matches and mean text similarity), so the trade-off is visible before
+enabling quantization in production.
+"""
+import argparse
+import difflib
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROMPTS = [
+    "I've been feeling really down lately and I don't know why.",
+    "My exams are next week and I can't stop worrying about them.",
+    "I had a great day today, I finally finished my project!",
+    "I feel lonely since I moved to a new city.",
+    "My best friend and I had a big fight yesterday.",
+    "I can't sleep at night because my mind keeps racing.",
+    "Work has been so stressful, I feel completely burnt out.",
+    "I'm nervous about starting my new job on Monday.",
+    "Sometimes I feel like nobody really listens to me.",
+    "I went for a walk in the park and it helped me relax.",
+]
+
+
+def load_prompts(path):
+    if not path:
+        return PROMPTS
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def generate_replies(app, tokenizer, model, prompts, runs):
+    """Return (replies, per-prompt median seconds) using the app's decoding settings"""
+    import torch
+
+    replies = []
+    latencies = []
+    for prompt in prompts:
+        inputs = tokenizer([prompt], return_tensors="pt", truncation=True,
+                           max_length=app.max_input_tokens(model, tokenizer))
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            with torch.no_grad():
+                reply_ids = model.generate(**inputs, **app.generation_kwargs(tokenizer))
+            samples.append(time.perf_counter() - started)
+        replies.append(tokenizer.decode(reply_ids[0], skip_special_tokens=True))
+        latencies.append(statistics.median(samples))
+    return replies, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help="Timed generations per prompt")
+    parser.add_argument('--prompts', help="File with one prompt per line (defaults to a built-in set)")
+    parser.add_argument('--show', action='store_true', help="Print each pair of replies")
+    args = parser.parse_args()
+    prompts = load_prompts(args.prompts)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ.setdefault('DATABASE_URI', f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+        import app
+        import torch
+
+        # Identical seeds in case the generation config samples
+        torch.manual_seed(0)
+        results = {}
+        for mode in ('', 'int8'):
+            app.KDC_QUANTIZE = mode
+            started = time.perf_counter()
+            tokenizer, model = app.load_kdc_model()
+            load_seconds = time.perf_counter() - started
+            replies, latencies = generate_replies(app, tokenizer, model, prompts, args.runs)
+            results[mode or 'fp32'] = (replies, latencies, load_seconds)
+            del model
+
+    fp32_replies, fp32_latencies, fp32_load = results['fp32']
+    int8_replies, int8_latencies, int8_load = results['int8']
+    similarity = [difflib.SequenceMatcher(None, a, b).ratio() for a, b in zip(fp32_replies, int8_replies)]
+    exact = sum(1 for a, b in zip(fp32_replies, int8_replies) if a == b)
+
+    if args.show:
+        for prompt, a, b in zip(prompts, fp32_replies, int8_replies):
+            print(f"> {prompt}\n  fp32: {a}\n  int8: {b}\n")
+
+    fp32_median = statistics.median(fp32_latencies)
+    int8_median = statistics.median(int8_latencies)
+    print(f"{'mode':<6} {'load s':>8} {'median s':>9} {'p90 s':>8}")
+    for label, latencies, load_seconds in (('fp32', fp32_latencies, fp32_load), ('int8', int8_latencies, int8_load)):
+        p90 = sorted(latencies)[int(0.9 * (len(latencies) - 1))]
+        print(f"{label:<6} {load_seconds:8.2f} {statistics.median(latencies):9.3f} {p90:8.3f}")
+    print()
+    print(f"speedup:          {fp32_median / int8_median:.2f}x")
+    print(f"exact matches:    {exact}/{len(prompts)}")
+    print(f"mean similarity:  {statistics.mean(similarity):.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Cold-start benchmark for the Empathy Soul app.
+
+Usage:
+    python benchmarks/startup.py [--top 15] [--runs 3] [--max-seconds 5]
+
+Each run starts a fresh interpreter, imports ``app`` with ``-X importtime``
+and serves one request to ``/`` through the test client. Reports the slowest
+modules by cumulative import time and the time to first response, and exits
+non-zero when the median exceeds ``--max-seconds``, so it can guard against
+cold-start regressions (e.g. a heavy import creeping back into module scope).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy dependencies that should not be imported just to serve a page
+HEAVY_MODULES = ('torch', 'transformers', 'gtts', 'requests')
+
+PROBE = r'''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+# Checked before the first request, which starts the background model load
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+response = app.init_app().test_client().get('/')
+finished = time.perf_counter()
+print(json.dumps({{
+    'import_seconds': imported - started,
+    'first_response_seconds': finished - started,
+    'status': response.status_code,
+    'heavy_modules_loaded': heavy,
+}}))
+'''
+
+
+def parse_importtime(stderr):
+    """Return [(cumulative_us, self_us, module)] from ``-X importtime`` output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        try:
+            self_us, cumulative_us, module = line[len('import time:'):].split('|', 2)
+            # Nested imports are indented below the module that pulled them in
+            rows.append((int(cumulative_us), int(self_us), module[1:].rstrip()))
+        except ValueError:
+            continue
+    return rows
+
+
+def run_once():
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ)
+        # Keep the benchmark from touching the real database
+        env.setdefault('DATABASE_URI', f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+        env['PYTHONPATH'] = APP_DIR + os.pathsep + env.get('PYTHONPATH', '')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE.format(heavy=HEAVY_MODULES)],
+            cwd=workdir,
+            env=env,
+            capture_output=True,
+            text=True
+        )
+    if result.returncode != 0:
+        print(result.stderr[-2000:], file=sys.stderr)
+        raise SystemExit("Probe process failed")
+    summary = json.loads(result.stdout.strip().splitlines()[-1])
+    return summary, parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help="Fresh interpreters to start")
+    parser.add_argument('--top', type=int, default=15, help="Slowest direct imports of app.py to list")
+    parser.add_argument('--max-seconds', type=float, default=None, help="Fail if median first response is slower")
+    args = parser.parse_args()
+
+    summaries = []
+    imports = None
+    for _ in range(args.runs):
+        summary, rows = run_once()
+        summaries.append(summary)
+        imports = rows
+
+    # Modules imported directly by app.py sit one indent level below it
+    top_level = sorted((row for row in imports if row[2].startswith('  ') and not row[2].startswith('    ')),
+                       reverse=True)
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, module in top_level[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {module.strip()}")
+
+    import_median = statistics.median(s['import_seconds'] for s in summaries)
+    first_median = statistics.median(s['first_response_seconds'] for s in summaries)
+    print()
+    print(f"import app:            {import_median:.3f}s (median of {args.runs})")
+    print(f"time to first response: {first_median:.3f}s (status {summaries[-1]['status']})")
+    heavy = summaries[-1]['heavy_modules_loaded']
+    print(f"heavy modules at import: {', '.join(heavy) if heavy else 'none'}")
+
+    if args.max_seconds is not None and first_median > args.max_seconds:
+        raise SystemExit(f"Cold start regressed: {first_median:.3f}s > {args.max_seconds:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
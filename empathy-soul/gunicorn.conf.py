@@ -0,0 +1,28 @@
+"""Gunicorn settings for Empathy Soul: gunicorn -c gunicorn.conf.py wsgi:application
+
+The app (and the BlenderBot weights) is imported once in the master and the
+workers are forked from it, so they share one copy of the weights
+copy-on-write instead of each loading their own. Each worker runs several
+threads so concurrent chat requests can still be batched together.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5001')
+workers = int(os.getenv('WEB_CONCURRENCY', str(min(multiprocessing.cpu_count(), 4))))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+# Long enough for a slow generate call or a long-polled audio request
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+preload_app = True
+
+
+def post_fork(server, worker):
+    import app
+
+    if app.kdc_loader.ready:
+        import torch
+
+        # Split the cores between workers instead of every worker using all of them
+        torch_threads = int(os.getenv('KDC_TORCH_THREADS', '0'))
+        torch.set_num_threads(torch_threads or max(1, multiprocessing.cpu_count() // server.cfg.workers))
@@ -0,0 +1,16 @@
+"""Inference helpers for the KDC AI companion"""
+
+from .assisted import load_draft, truncated_draft
+from .batching import PRIORITY_HIGH, PRIORITY_NORMAL, BatchScheduler, QueueFull
+from .checkpoint import load_mmapped, local_checkpoint
+from .conversation import ConversationStore
+from .loader import ModelLoader
+from .quantization import load_quantized, quantize_dynamic, quantized_cache_path
+from .router import CascadeRouter
+from .streaming import max_input_tokens, sse_event, stream_reply
+
+__all__ = [
+    'PRIORITY_HIGH', 'PRIORITY_NORMAL', 'BatchScheduler', 'CascadeRouter', 'ConversationStore', 'ModelLoader',
+    'QueueFull', 'load_draft', 'load_mmapped', 'load_quantized', 'local_checkpoint', 'max_input_tokens',
+    'quantize_dynamic', 'quantized_cache_path', 'sse_event', 'stream_reply', 'truncated_draft'
+]
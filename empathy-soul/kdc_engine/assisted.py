@@ -0,0 +1,72 @@
+import copy
+import logging
+
+logger = logging.getLogger(__name__)
+
+LAYERS_PREFIX = 'layers:'
+
+
+def truncated_draft(model, decoder_layers):
+    """Return a draft of ``model`` that keeps only its first ``decoder_layers`` decoder layers.
+
+    The draft shares every module with ``model`` (embeddings, encoder, the
+    kept decoder layers, final norm and LM head), so it costs no extra
+    memory and works the same on fp32 and int8-quantized weights. It
+    proposes tokens from an early exit of the decoder; ``model`` then
+    verifies them, so the replies are unchanged, only faster when the
+    shallow decoder agrees with the full one often enough.
+    """
+    import torch
+
+    total = model.config.decoder_layers
+    if not 0 < decoder_layers < total:
+        raise ValueError(f"Draft must keep between 1 and {total - 1} decoder layers, got {decoder_layers}")
+
+    config = copy.deepcopy(model.config)
+    config.decoder_layers = decoder_layers
+    # Nothing is allocated: every module is replaced by the one from model below
+    with torch.device('meta'):
+        draft = type(model)(config)
+
+    base, draft_base = model.base_model, draft.base_model
+    for name, child in model.named_children():
+        if child is not base:
+            setattr(draft, name, child)
+    for name, child in base.named_children():
+        if child is not base.get_decoder():
+            setattr(draft_base, name, child)
+    draft_decoder = draft_base.get_decoder()
+    for name, child in base.get_decoder().named_children():
+        if name == 'layers':
+            child = torch.nn.ModuleList(list(child)[:decoder_layers])
+        setattr(draft_decoder, name, child)
+    for name, buffer in model.named_buffers(recurse=False):
+        draft.register_buffer(name, buffer)
+
+    missing = [name for name, tensor in list(draft.named_parameters()) + list(draft.named_buffers()) if tensor.is_meta]
+    if missing:
+        raise ValueError(f"Draft model has {len(missing)} unshared tensors, e.g. {missing[0]}")
+    draft.generation_config = model.generation_config
+    draft.eval()
+    return draft
+
+
+def load_draft(spec, model, load_pretrained):
+    """Return the assistant model described by ``spec`` for ``model``.
+
+    ``spec`` is either ``layers:N`` for a :func:`truncated_draft` of ``model``
+    or a model name/path passed to ``load_pretrained``. A separate draft must
+    share the main model's vocabulary, since assisted decoding exchanges
+    token ids between the two.
+    """
+    if spec.startswith(LAYERS_PREFIX):
+        return truncated_draft(model, int(spec[len(LAYERS_PREFIX):]))
+
+    draft = load_pretrained(spec)
+    if draft.config.vocab_size != model.config.vocab_size:
+        raise ValueError(
+            f"Draft model {spec} has a vocabulary of {draft.config.vocab_size} tokens, "
+            f"the main model {model.config.vocab_size}"
+        )
+    draft.eval()
+    return draft
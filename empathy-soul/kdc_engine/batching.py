@@ -0,0 +1,208 @@
+import itertools
+import logging
+import math
+import queue
+import threading
+import time
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+# Lower values are served first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+
+class QueueFull(Exception):
+    """Raised by :meth:`BatchScheduler.submit` when a request is shed"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Inference queue is full; retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class _PendingRequest:
+    """A single caller waiting for its reply from a batched generate call"""
+
+    def __init__(self, text, timeout=None):
+        self.text = text
+        self.enqueued_at = time.monotonic()
+        self.deadline = None if timeout is None else self.enqueued_at + timeout
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchScheduler:
+    """Collect concurrent requests into micro-batches for one generate call.
+
+    The worker thread blocks until a request arrives, then keeps collecting
+    for up to ``max_wait_ms`` or until ``max_batch_size`` requests are queued,
+    whichever comes first. ``generate_batch`` receives the list of texts and
+    must return one reply per text, in order, and is passed ``max_time``: the
+    seconds left before the loosest deadline in the batch (None if any
+    request has no deadline), so it can stop generating once every caller
+    has given up. A caller with a tighter deadline times out in
+    :meth:`submit` without cutting short the replies of the others.
+
+    With ``max_queue`` set, normal requests are shed with :class:`QueueFull`
+    once that many are waiting. ``PRIORITY_HIGH`` requests are always taken
+    ahead of normal ones and are only shed at twice that depth.
+    """
+
+    def __init__(self, generate_batch, max_batch_size=8, max_wait_ms=20, sample_size=1000, max_queue=None):
+        self.generate_batch = generate_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms) / 1000.0)
+        self.max_queue = max_queue
+        self._queue = queue.PriorityQueue()
+        # Keeps requests of equal priority in arrival order
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._queue_waits = deque(maxlen=sample_size)
+        self._batch_times = deque(maxlen=sample_size)
+        self._requests = 0
+        self._batches = 0
+        self._errors = 0
+        self._expired = 0
+        self._admitted = Counter()
+        self._shed = Counter()
+        self._worker = None
+
+    def start(self):
+        """Start the worker thread if it is not running yet"""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="kdc-batcher", daemon=True)
+                self._worker.start()
+        return self
+
+    def submit(self, text, timeout=None, priority=PRIORITY_NORMAL):
+        """Queue ``text`` and block until its reply is ready.
+
+        ``timeout`` is also the request's deadline: a request still queued
+        when it passes is dropped instead of generated, and either way the
+        caller gets a ``TimeoutError``. Raises :class:`QueueFull` instead of
+        queueing when the request is shed.
+        """
+        self.start()
+        lane = 'high' if priority == PRIORITY_HIGH else 'normal'
+        with self._lock:
+            if self.max_queue is not None:
+                limit = self.max_queue * 2 if priority == PRIORITY_HIGH else self.max_queue
+                if self._queue.qsize() >= limit:
+                    self._shed[lane] += 1
+                    raise QueueFull(self._retry_after())
+            self._admitted[lane] += 1
+        pending = _PendingRequest(text, timeout)
+        self._queue.put((priority, next(self._sequence), pending))
+        if not pending.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for a batched reply")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect(self):
+        batch = [self._queue.get()[2]]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining)[2])
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._drop_expired(self._collect())
+            if not batch:
+                continue
+            started = time.monotonic()
+            deadlines = [pending.deadline for pending in batch]
+            # One client's tight budget must not truncate its batch mates' replies
+            max_time = None if None in deadlines else max(deadlines) - started
+            try:
+                replies = self.generate_batch([pending.text for pending in batch], max_time=max_time)
+                if len(replies) != len(batch):
+                    raise RuntimeError(f"Expected {len(batch)} replies, got {len(replies)}")
+                for pending, reply in zip(batch, replies):
+                    pending.result = reply
+            except Exception as e:
+                logger.exception("Error in batched generation")
+                with self._lock:
+                    self._errors += 1
+                for pending in batch:
+                    pending.error = e
+            finally:
+                self._record(batch, started)
+                for pending in batch:
+                    pending.done.set()
+
+    def _retry_after(self):
+        # Called with the lock held: seconds to drain the queue at the recent batch rate
+        if not self._batch_times:
+            return 1
+        batches = math.ceil((self._queue.qsize() + 1) / self.max_batch_size)
+        mean_batch_time = sum(self._batch_times) / len(self._batch_times)
+        return max(1, math.ceil(batches * mean_batch_time))
+
+    def _drop_expired(self, batch):
+        now = time.monotonic()
+        live = []
+        for pending in batch:
+            if pending.deadline is not None and pending.deadline <= now:
+                # The caller has already given up waiting
+                pending.error = TimeoutError("Deadline passed before generation started")
+                pending.done.set()
+                with self._lock:
+                    self._expired += 1
+            else:
+                live.append(pending)
+        return live
+
+    def _record(self, batch, started):
+        finished = time.monotonic()
+        with self._lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._batch_sizes[len(batch)] += 1
+            self._batch_times.append(finished - started)
+            for pending in batch:
+                self._queue_waits.append(started - pending.enqueued_at)
+
+    def metrics(self):
+        """Return batch-size and queue-wait statistics for tuning"""
+        with self._lock:
+            waits = sorted(self._queue_waits)
+            batch_times = sorted(self._batch_times)
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': round(self.max_wait * 1000, 3),
+                'queue_depth': self._queue.qsize(),
+                'max_queue': self.max_queue,
+                'admitted': dict(self._admitted),
+                'shed': dict(self._shed),
+                'requests': self._requests,
+                'batches': self._batches,
+                'errors': self._errors,
+                'expired': self._expired,
+                'mean_batch_size': round(self._requests / self._batches, 3) if self._batches else 0.0,
+                'batch_size_histogram': {str(size): count for size, count in sorted(self._batch_sizes.items())},
+                'queue_wait_ms': _percentiles(waits),
+                'batch_time_ms': _percentiles(batch_times),
+            }
+
+
+def _percentiles(samples):
+    if not samples:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+
+    def pick(q):
+        index = min(len(samples) - 1, int(round(q * (len(samples) - 1))))
+        return round(samples[index] * 1000, 3)
+
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(samples[-1] * 1000, 3)}
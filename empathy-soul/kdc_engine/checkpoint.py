@@ -0,0 +1,133 @@
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import uuid
+
+logger = logging.getLogger(__name__)
+
+WEIGHTS_NAME = "model.safetensors"
+
+# safetensors dtype tags -> torch dtype names
+_DTYPES = {
+    'F64': 'float64',
+    'F32': 'float32',
+    'F16': 'float16',
+    'BF16': 'bfloat16',
+    'I64': 'int64',
+    'I32': 'int32',
+    'I16': 'int16',
+    'I8': 'int8',
+    'U8': 'uint8',
+    'BOOL': 'bool',
+}
+
+
+def local_checkpoint(model_name, cache_dir, model_class, tokenizer_class):
+    """Return a local directory holding ``model_name`` as a single safetensors file.
+
+    The first call downloads the model, converts it and saves it together with
+    its tokenizer under ``cache_dir``; later calls (and other processes) reuse
+    that directory. A local directory that already contains safetensors
+    weights is returned as is.
+    """
+    if os.path.isfile(os.path.join(model_name, WEIGHTS_NAME)):
+        return model_name
+
+    target = os.path.join(os.path.abspath(cache_dir), model_name.replace('/', '--'))
+    if os.path.isfile(os.path.join(target, WEIGHTS_NAME)):
+        return target
+
+    logger.info(f"Converting {model_name} to a local safetensors checkpoint in {target}")
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Build in a private directory so a concurrent loader never sees half a checkpoint
+    tmp_dir = f"{target}.{uuid.uuid4().hex}.tmp"
+    try:
+        model = model_class.from_pretrained(model_name, low_cpu_mem_usage=True)
+        # One unsharded file, so it can be mapped in a single call
+        model.save_pretrained(tmp_dir, safe_serialization=True, max_shard_size="100GB")
+        del model
+        tokenizer_class.from_pretrained(model_name).save_pretrained(tmp_dir)
+        try:
+            os.rename(tmp_dir, target)
+        except OSError:
+            # Another process finished the same conversion first
+            if not os.path.isfile(os.path.join(target, WEIGHTS_NAME)):
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return target
+
+
+def read_safetensors(path):
+    """Map a safetensors file and return ``{name: tensor}`` backed by the mapping.
+
+    The tensors share the page cache with every other process mapping the
+    same file, so loading costs little more than the mmap itself. The mapping
+    is private: a write to a tensor copies only the touched page and never
+    reaches the file.
+    """
+    import torch
+
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    data_start = 8 + header_size
+    tensors = {}
+    for name, info in header.items():
+        if name == '__metadata__':
+            continue
+        dtype = getattr(torch, _DTYPES[info['dtype']])
+        begin, end = info['data_offsets']
+        shape = info['shape']
+        if end == begin:
+            tensors[name] = torch.empty(shape, dtype=dtype)
+            continue
+        count = (end - begin) // torch.empty((), dtype=dtype).element_size()
+        tensors[name] = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + begin).view(shape)
+    return tensors
+
+
+def load_mmapped(model_class, checkpoint_dir):
+    """Instantiate ``model_class`` from ``checkpoint_dir`` with memory-mapped weights.
+
+    The model is built on the meta device, so no memory is allocated for the
+    randomly initialised weights, and its parameters are then pointed at the
+    mapped checkpoint. The returned model is meant for inference only.
+    """
+    import torch
+    from transformers import AutoConfig, GenerationConfig
+
+    config = AutoConfig.from_pretrained(checkpoint_dir)
+    with torch.device('meta'):
+        model = model_class(config)
+
+    state = read_safetensors(os.path.join(checkpoint_dir, WEIGHTS_NAME))
+    for name, tensor in state.items():
+        module_name, _, attr = name.rpartition('.')
+        try:
+            module = model.get_submodule(module_name)
+        except AttributeError:
+            logger.warning(f"Ignoring unexpected checkpoint tensor {name}")
+            continue
+        if attr in module._parameters:
+            module._parameters[attr] = torch.nn.Parameter(tensor, requires_grad=False)
+        elif attr in module._buffers:
+            module._buffers[attr] = tensor
+        else:
+            logger.warning(f"Ignoring unexpected checkpoint tensor {name}")
+
+    # Tied weights (e.g. the shared embeddings and lm_head) are stored only once
+    model.tie_weights()
+    missing = [name for name, tensor in list(model.named_parameters()) + list(model.named_buffers()) if tensor.is_meta]
+    if missing:
+        raise ValueError(f"Checkpoint is missing {len(missing)} tensors, e.g. {missing[0]}")
+
+    if os.path.isfile(os.path.join(checkpoint_dir, 'generation_config.json')):
+        model.generation_config = GenerationConfig.from_pretrained(checkpoint_dir)
+    model.eval()
+    return model
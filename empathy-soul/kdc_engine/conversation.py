@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class _Session:
+    """The recent turns of one user's conversation"""
+
+    def __init__(self, max_turns):
+        # (text, is_user, token count) per turn, oldest first
+        self.turns = deque(maxlen=max_turns)
+        self.tokens = 0
+        self.last_seen = time.monotonic()
+
+
+class ConversationStore:
+    """Bounded, per-user dialogue history used as multi-turn model context.
+
+    Each session keeps only the most recent turns that fit in
+    ``token_budget`` tokens, so building the context costs the same however
+    long the conversation runs: older turns are dropped from the left as new
+    ones arrive, and every turn is tokenized once, when it is recorded.
+    Sessions idle for ``idle_seconds`` are dropped, and beyond
+    ``max_sessions`` the least recently used session is evicted.
+
+    The context is formatted the way BlenderBot was trained on dialogue:
+    turns joined by two spaces, user turns prefixed with a space.
+    """
+
+    def __init__(self, count_tokens, token_budget=120, max_turns=16, max_sessions=1000, idle_seconds=1800):
+        self.count_tokens = count_tokens
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._evicted = 0
+        self._expired = 0
+        self._truncated = 0
+
+    def context_for(self, session_id, message):
+        """Return the model input for ``message``, preceded by as much history as fits"""
+        pieces = [' ' + message]
+        budget = self.token_budget - self.count_tokens(pieces[0])
+        with self._lock:
+            session = self._get(session_id)
+            if session is not None:
+                for text, is_user, tokens in reversed(session.turns):
+                    # Two separator spaces per turn, roughly one token
+                    budget -= tokens + 1
+                    if budget < 0:
+                        break
+                    pieces.append(' ' + text if is_user else text)
+        return '  '.join(reversed(pieces))
+
+    def record(self, session_id, message, reply):
+        """Append a user message and the reply it got to the session's history"""
+        turns = [(message, True, self.count_tokens(' ' + message)), (reply, False, self.count_tokens(reply))]
+        with self._lock:
+            self._expire_idle()
+            session = self._get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(self.max_turns)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self._evicted += 1
+            for turn in turns:
+                if len(session.turns) == session.turns.maxlen:
+                    session.tokens -= session.turns[0][2]
+                session.turns.append(turn)
+                session.tokens += turn[2]
+            # Left-truncate to the budget so history never outgrows what is used
+            while len(session.turns) > 2 and session.tokens > self.token_budget:
+                session.tokens -= session.turns.popleft()[2]
+                self._truncated += 1
+            session.last_seen = time.monotonic()
+
+    def reset(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'token_budget': self.token_budget,
+                'evicted': self._evicted,
+                'expired': self._expired,
+                'truncated_turns': self._truncated,
+            }
+
+    def _get(self, session_id):
+        # Called with the lock held
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if time.monotonic() - session.last_seen > self.idle_seconds:
+            del self._sessions[session_id]
+            self._expired += 1
+            return None
+        self._sessions.move_to_end(session_id)
+        session.last_seen = time.monotonic()
+        return session
+
+    def _expire_idle(self):
+        # Sessions are kept in access order, so the idle ones are at the front
+        now = time.monotonic()
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_seen <= self.idle_seconds:
+                break
+            self._sessions.popitem(last=False)
+            self._expired += 1
@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class ModelLoader:
+    """Load a model on a background thread and report its readiness.
+
+    ``load`` is called once and returns whatever the callers need (for KDC a
+    ``(tokenizer, model)`` pair). Until it finishes, :attr:`value` is None so
+    endpoints can answer with a cheap fallback instead of blocking.
+    """
+
+    def __init__(self, load, name="model"):
+        self.load = load
+        self.name = name
+        self.state = PENDING
+        self.error = None
+        self.value = None
+        self.load_seconds = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Begin loading in the background; later calls are no-ops"""
+        with self._lock:
+            if self._thread is None:
+                self.state = LOADING
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-loader", daemon=True)
+                self._thread.start()
+        return self
+
+    def load_now(self):
+        """Load on the calling thread (e.g. in a pre-fork master) and return the value"""
+        with self._lock:
+            if self._thread is None:
+                self.state = LOADING
+                self._thread = threading.current_thread()
+                run_here = True
+            else:
+                run_here = False
+        if run_here:
+            self._run()
+        else:
+            self._done.wait()
+        return self.value
+
+    def wait(self, timeout=None):
+        """Block until loading finishes; True when the model is ready"""
+        self._done.wait(timeout)
+        return self.state == READY
+
+    @property
+    def ready(self):
+        return self.state == READY
+
+    def status(self):
+        return {
+            'name': self.name,
+            'state': self.state,
+            'load_seconds': self.load_seconds,
+            'error': str(self.error) if self.error else None,
+        }
+
+    def _run(self):
+        started = time.monotonic()
+        logger.info(f"Loading {self.name}...")
+        try:
+            self.value = self.load()
+            self.state = READY
+            logger.info(f"{self.name} ready")
+        except Exception as e:
+            logger.exception(f"Error loading {self.name}")
+            self.error = e
+            self.state = FAILED
+        finally:
+            self.load_seconds = round(time.monotonic() - started, 3)
+            self._done.set()
@@ -0,0 +1,343 @@
+import inspect
+import logging
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ENCODER_NAME = "encoder.onnx"
+DECODER_NAME = "decoder.onnx"
+DECODER_WITH_PAST_NAME = "decoder_with_past.onnx"
+ONNX_OPSET = 14
+
+
+def _to_legacy_cache(past):
+    """Return past key/values as ``((self_k, self_v, cross_k, cross_v), ...)`` per layer"""
+    if hasattr(past, 'to_legacy_cache'):
+        return past.to_legacy_cache()
+    if hasattr(past, 'self_attention_cache'):
+        # transformers releases whose cache objects have no legacy conversion
+        return tuple(
+            (own.keys, own.values, cross.keys, cross.values)
+            for own, cross in zip(past.self_attention_cache.layers, past.cross_attention_cache.layers)
+        )
+    return past
+
+
+def _from_legacy_cache(past):
+    """Inverse of :func:`_to_legacy_cache` for whichever format the decoder expects"""
+    try:
+        from transformers.cache_utils import DynamicCache, EncoderDecoderCache
+    except ImportError:
+        # transformers before 4.36 takes the tuples directly
+        return past
+    if hasattr(EncoderDecoderCache, 'from_legacy_cache'):
+        return EncoderDecoderCache.from_legacy_cache(past)
+    cache = EncoderDecoderCache(DynamicCache(), DynamicCache())
+    for layer, (key, value, cross_key, cross_value) in enumerate(past):
+        cache.self_attention_cache.update(key, value, layer)
+        cache.cross_attention_cache.update(cross_key, cross_value, layer)
+        cache.is_updated[layer] = True
+    return cache
+
+
+def _past_names(prefix, layers, cross=True):
+    names = []
+    for layer in range(layers):
+        names += [f"{prefix}.{layer}.key", f"{prefix}.{layer}.value"]
+        if cross:
+            names += [f"{prefix}.{layer}.cross_key", f"{prefix}.{layer}.cross_value"]
+    return names
+
+
+def export_onnx(model, output_dir):
+    """Export ``model`` (a BlenderBot-style seq2seq model) as three ONNX graphs.
+
+    ``encoder.onnx`` runs once per request, ``decoder.onnx`` takes the first
+    decoder step and returns the self- and cross-attention key/values, and
+    ``decoder_with_past.onnx`` takes one token plus the cached key/values and
+    returns the grown self-attention cache. The configs are saved alongside.
+    The export is written to a temporary directory and renamed into place.
+    """
+    import torch
+
+    class Encoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.encoder = model.get_encoder()
+
+        def forward(self, input_ids, attention_mask):
+            outputs = self.encoder(input_ids=input_ids, attention_mask=attention_mask, return_dict=True)
+            return outputs.last_hidden_state
+
+    class Decoder(torch.nn.Module):
+        def __init__(self, with_past):
+            super().__init__()
+            self.decoder = model.get_decoder()
+            self.lm_head = model.lm_head
+            self.final_logits_bias = model.final_logits_bias
+            self.with_past = with_past
+
+        def forward(self, input_ids, encoder_hidden_states, encoder_attention_mask, *past):
+            if self.with_past:
+                layers = [tuple(past[i:i + 4]) for i in range(0, len(past), 4)]
+                past = _from_legacy_cache(tuple(layers))
+            else:
+                past = None
+            outputs = self.decoder(
+                input_ids=input_ids,
+                encoder_hidden_states=encoder_hidden_states,
+                encoder_attention_mask=encoder_attention_mask,
+                past_key_values=past,
+                use_cache=True,
+                return_dict=True
+            )
+            logits = self.lm_head(outputs.last_hidden_state) + self.final_logits_bias
+            present = []
+            for key, value, cross_key, cross_value in _to_legacy_cache(outputs.past_key_values):
+                # The cross-attention cache never changes after the first step
+                present += [key, value] if self.with_past else [key, value, cross_key, cross_value]
+            return (logits, *present)
+
+    config = model.config
+    layers = config.decoder_layers
+    heads = config.decoder_attention_heads
+    head_dim = config.d_model // heads
+    batch, source_length = 2, 7
+
+    input_ids = torch.ones((batch, source_length), dtype=torch.long)
+    attention_mask = torch.ones((batch, source_length), dtype=torch.long)
+    hidden = torch.zeros((batch, source_length, config.d_model))
+    decoder_ids = torch.full((batch, 1), config.decoder_start_token_id, dtype=torch.long)
+    past = []
+    for _ in range(layers):
+        past += [torch.zeros((batch, heads, 3, head_dim))] * 2
+        past += [torch.zeros((batch, heads, source_length, head_dim))] * 2
+
+    present_init = _past_names('present', layers)
+    past_inputs = _past_names('past', layers)
+    present_with_past = _past_names('present', layers, cross=False)
+    axes = {name: {0: 'batch', 1: 'source'} for name in ('attention_mask', 'encoder_hidden_states',
+                                                         'encoder_attention_mask')}
+    axes['logits'] = {0: 'batch'}
+    for name in past_inputs:
+        axes[name] = {0: 'batch', 2: 'source' if 'cross' in name else 'past'}
+    for name in present_init + present_with_past:
+        axes[name] = {0: 'batch', 2: 'source' if 'cross' in name else 'past_plus_one'}
+
+    options = {'opset_version': ONNX_OPSET, 'do_constant_folding': True}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        # The TorchScript exporter handles the dynamic past lengths used here
+        options['dynamo'] = False
+
+    def export(module, args, filename, input_names, output_names, input_ids_axes):
+        dynamic_axes = {name: axes[name] for name in input_names + output_names if name in axes}
+        dynamic_axes['input_ids'] = input_ids_axes
+        torch.onnx.export(module.eval(), args, os.path.join(tmp_dir, filename), input_names=input_names,
+                          output_names=output_names, dynamic_axes=dynamic_axes, **options)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_dir)), exist_ok=True)
+    tmp_dir = f"{output_dir}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp_dir)
+    try:
+        decoder_inputs = ['input_ids', 'encoder_hidden_states', 'encoder_attention_mask']
+        with torch.no_grad():
+            export(Encoder(), (input_ids, attention_mask), ENCODER_NAME,
+                   ['input_ids', 'attention_mask'], ['encoder_hidden_states'], {0: 'batch', 1: 'source'})
+            export(Decoder(with_past=False), (decoder_ids, hidden, attention_mask), DECODER_NAME,
+                   decoder_inputs, ['logits'] + present_init, {0: 'batch'})
+            export(Decoder(with_past=True), (decoder_ids, hidden, attention_mask, *past), DECODER_WITH_PAST_NAME,
+                   decoder_inputs + past_inputs, ['logits'] + present_with_past, {0: 'batch'})
+        config.save_pretrained(tmp_dir)
+        model.generation_config.save_pretrained(tmp_dir)
+        try:
+            os.rename(tmp_dir, output_dir)
+        except OSError:
+            # Another process finished the same export first
+            if not os.path.isfile(os.path.join(output_dir, DECODER_WITH_PAST_NAME)):
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return output_dir
+
+
+def load_onnx(model_dir, load_model, threads=0):
+    """Return an :class:`OnnxSeq2Seq` for ``model_dir``, exporting ``load_model()`` there first if needed"""
+    if not os.path.isfile(os.path.join(model_dir, DECODER_WITH_PAST_NAME)):
+        logger.info(f"Exporting the model to ONNX in {model_dir}")
+        export_onnx(load_model(), model_dir)
+    return OnnxSeq2Seq(model_dir, threads=threads)
+
+
+class OnnxSeq2Seq:
+    """Greedy or sampled seq2seq generation on ONNX Runtime.
+
+    Exposes the subset of ``model.generate`` that the KDC endpoints use, so it
+    can stand in for the torch model: the encoder runs once, and every later
+    decoder step feeds back only the newest token together with the cached
+    self-attention key/values. Beam search is not implemented; ``num_beams``
+    is ignored and decoding is greedy unless ``do_sample`` is set.
+    """
+
+    def __init__(self, model_dir, threads=0):
+        import onnxruntime
+        from transformers import AutoConfig, GenerationConfig
+
+        self.model_dir = model_dir
+        self.config = AutoConfig.from_pretrained(model_dir)
+        self.generation_config = GenerationConfig.from_pretrained(model_dir)
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        providers = ['CPUExecutionProvider']
+        self.encoder = onnxruntime.InferenceSession(os.path.join(model_dir, ENCODER_NAME), options, providers=providers)
+        self.decoder = onnxruntime.InferenceSession(os.path.join(model_dir, DECODER_NAME), options, providers=providers)
+        self.decoder_with_past = onnxruntime.InferenceSession(
+            os.path.join(model_dir, DECODER_WITH_PAST_NAME), options, providers=providers
+        )
+        # Graphs may drop inputs that ended up unused (e.g. hidden states once cached)
+        self._decoder_inputs = {i.name for i in self.decoder.get_inputs()}
+        self._with_past_inputs = {i.name for i in self.decoder_with_past.get_inputs()}
+        self._layers = self.config.decoder_layers
+        self._rng = np.random.default_rng()
+
+    def eval(self):
+        return self
+
+    def generate(self, input_ids, attention_mask=None, max_length=None, min_length=None, do_sample=None,
+                 temperature=None, top_k=None, top_p=None, no_repeat_ngram_size=None,
+                 encoder_no_repeat_ngram_size=None, pad_token_id=None, eos_token_id=None, streamer=None,
+                 max_time=None, **unused):
+        """Return the generated ids (start token first) as a padded int64 array"""
+        defaults = self.generation_config
+        pick = lambda value, name, fallback=None: value if value is not None else (
+            getattr(defaults, name, None) if getattr(defaults, name, None) is not None else fallback
+        )
+        max_length = pick(max_length, 'max_length', 20)
+        min_length = pick(min_length, 'min_length', 0)
+        do_sample = pick(do_sample, 'do_sample', False)
+        temperature = pick(temperature, 'temperature', 1.0)
+        top_k = pick(top_k, 'top_k', 0)
+        top_p = pick(top_p, 'top_p', 1.0)
+        no_repeat_ngram_size = pick(no_repeat_ngram_size, 'no_repeat_ngram_size', 0)
+        encoder_no_repeat_ngram_size = pick(encoder_no_repeat_ngram_size, 'encoder_no_repeat_ngram_size', 0)
+        eos_token_id = pick(eos_token_id, 'eos_token_id', self.config.eos_token_id)
+        pad_token_id = pick(pad_token_id, 'pad_token_id', eos_token_id)
+        forced_eos_token_id = getattr(defaults, 'forced_eos_token_id', None)
+        start_token_id = pick(None, 'decoder_start_token_id', self.config.decoder_start_token_id)
+
+        started = time.monotonic()
+        input_ids = _as_numpy(input_ids)
+        attention_mask = np.ones_like(input_ids) if attention_mask is None else _as_numpy(attention_mask)
+        batch = input_ids.shape[0]
+
+        hidden_states = self.encoder.run(None, {'input_ids': input_ids, 'attention_mask': attention_mask})[0]
+        sequences = np.full((batch, 1), start_token_id, dtype=np.int64)
+        if streamer is not None:
+            streamer.put(_as_tensor(sequences))
+        encoder_ngrams = [_ngrams(row[mask.astype(bool)].tolist(), encoder_no_repeat_ngram_size)
+                          for row, mask in zip(input_ids, attention_mask)] if encoder_no_repeat_ngram_size else None
+        unfinished = np.ones(batch, dtype=bool)
+        cross_past = self_past = None
+
+        while sequences.shape[1] < max_length:
+            feeds = {'input_ids': sequences[:, -1:], 'encoder_attention_mask': attention_mask}
+            if self_past is None:
+                if 'encoder_hidden_states' in self._decoder_inputs:
+                    feeds['encoder_hidden_states'] = hidden_states
+                logits, *present = self.decoder.run(None, feeds)
+                self_past = [present[i:i + 2] for i in range(0, len(present), 4)]
+                cross_past = [present[i + 2:i + 4] for i in range(0, len(present), 4)]
+            else:
+                if 'encoder_hidden_states' in self._with_past_inputs:
+                    feeds['encoder_hidden_states'] = hidden_states
+                for layer in range(self._layers):
+                    feeds[f'past.{layer}.key'], feeds[f'past.{layer}.value'] = self_past[layer]
+                    feeds[f'past.{layer}.cross_key'], feeds[f'past.{layer}.cross_value'] = cross_past[layer]
+                feeds = {name: value for name, value in feeds.items() if name in self._with_past_inputs}
+                logits, *present = self.decoder_with_past.run(None, feeds)
+                self_past = [present[i:i + 2] for i in range(0, len(present), 2)]
+
+            scores = logits[:, -1, :].astype(np.float32)
+            length = sequences.shape[1]
+            if length < min_length:
+                scores[:, eos_token_id] = -np.inf
+            if forced_eos_token_id is not None and length == max_length - 1:
+                forced = scores[:, forced_eos_token_id].copy()
+                scores[:] = -np.inf
+                scores[:, forced_eos_token_id] = forced
+            for row in range(batch):
+                banned = []
+                if no_repeat_ngram_size:
+                    banned += _banned_tokens(_ngrams(sequences[row].tolist(), no_repeat_ngram_size),
+                                             sequences[row].tolist(), no_repeat_ngram_size)
+                if encoder_ngrams is not None:
+                    banned += _banned_tokens(encoder_ngrams[row], sequences[row].tolist(),
+                                             encoder_no_repeat_ngram_size)
+                if banned:
+                    scores[row, banned] = -np.inf
+
+            next_tokens = self._sample(scores, temperature, top_k, top_p) if do_sample else scores.argmax(axis=-1)
+            next_tokens = np.where(unfinished, next_tokens, pad_token_id).astype(np.int64)
+            sequences = np.concatenate([sequences, next_tokens[:, None]], axis=1)
+            if streamer is not None:
+                streamer.put(_as_tensor(next_tokens))
+            unfinished &= next_tokens != eos_token_id
+            if not unfinished.any():
+                break
+            if max_time is not None and time.monotonic() - started > max_time:
+                # Out of time budget: return what has been generated so far
+                break
+
+        if streamer is not None:
+            streamer.end()
+        return sequences
+
+    def _sample(self, scores, temperature, top_k, top_p):
+        scores = scores / max(temperature, 1e-5)
+        if top_k:
+            kth = np.sort(scores, axis=-1)[:, -min(top_k, scores.shape[-1])][:, None]
+            scores = np.where(scores < kth, -np.inf, scores)
+        probs = np.exp(scores - scores.max(axis=-1, keepdims=True))
+        probs /= probs.sum(axis=-1, keepdims=True)
+        if top_p < 1.0:
+            order = np.argsort(-probs, axis=-1)
+            sorted_probs = np.take_along_axis(probs, order, axis=-1)
+            # Keep the smallest prefix whose mass reaches top_p (always at least one token)
+            drop = np.cumsum(sorted_probs, axis=-1) - sorted_probs >= top_p
+            sorted_probs[drop] = 0.0
+            probs = np.zeros_like(probs)
+            np.put_along_axis(probs, order, sorted_probs, axis=-1)
+            probs /= probs.sum(axis=-1, keepdims=True)
+        return np.array([self._rng.choice(len(row), p=row) for row in probs])
+
+
+def _as_numpy(value):
+    if hasattr(value, 'cpu'):
+        value = value.cpu().numpy()
+    return np.asarray(value, dtype=np.int64)
+
+
+def _as_tensor(value):
+    # Streamers from transformers expect torch tensors
+    import torch
+    return torch.from_numpy(np.ascontiguousarray(value))
+
+
+def _ngrams(tokens, size):
+    ngrams = {}
+    for i in range(len(tokens) - size + 1):
+        prefix = tuple(tokens[i:i + size - 1])
+        ngrams.setdefault(prefix, []).append(tokens[i + size - 1])
+    return ngrams
+
+
+def _banned_tokens(ngrams, tokens, size):
+    """Tokens that would complete an n-gram already present in ``ngrams``"""
+    if len(tokens) + 1 < size:
+        return []
+    return ngrams.get(tuple(tokens[len(tokens) - size + 1:]), [])
@@ -0,0 +1,60 @@
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def quantized_cache_path(cache_dir, model_name):
+    """Return where the int8 copy of ``model_name`` is cached.
+
+    Pickled quantized modules are tied to the torch version and the quantized
+    engine that packed them, so both are part of the file name.
+    """
+    import torch
+
+    engine = torch.backends.quantized.engine
+    version = torch.__version__.split('+')[0]
+    name = model_name.strip('/').replace('/', '--')
+    return os.path.join(os.path.abspath(cache_dir), f"{name}.int8-{engine}-torch{version}.pt")
+
+
+def quantize_dynamic(model):
+    """Quantize every ``nn.Linear`` of ``model`` to int8 in place and return it.
+
+    Weights are stored as int8 and activations are quantized on the fly, which
+    speeds up CPU generation; embeddings and layer norms stay in fp32.
+    """
+    import torch
+
+    # In place, so weights mapped from a checkpoint are not copied first
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def load_quantized(path, load_model):
+    """Return the int8 model cached at ``path``, quantizing ``load_model()`` on a miss"""
+    import torch
+
+    if os.path.isfile(path):
+        try:
+            model = torch.load(path, weights_only=False)
+            model.eval()
+            logger.info(f"Loaded quantized model from {path}")
+            return model
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable quantized model {path}: {e}")
+
+    model = quantize_dynamic(load_model())
+    model.eval()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        torch.save(model, tmp_path)
+        os.replace(tmp_path, path)
+        logger.info(f"Cached quantized model in {path}")
+    except Exception as e:
+        logger.warning(f"Could not cache quantized model: {e}")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return model
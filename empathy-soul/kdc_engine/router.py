@@ -0,0 +1,79 @@
+import random
+import threading
+from collections import Counter
+
+CANNED = 'canned'
+MODEL = 'model'
+# Anything else that answered: keyword rules while the model loads, deadline fallbacks
+FALLBACK = 'fallback'
+TIERS = (CANNED, MODEL, FALLBACK)
+
+
+class CascadeRouter:
+    """Answer routine messages from canned replies and leave the rest to the model.
+
+    ``matcher`` is an ``IntentMatcher``. Intents with an entry in ``replies``
+    can be answered from it; the others (filler words such as "there" or
+    "today") only count towards the confidence. Confidence is the share of
+    the message's words covered by matched terms, so "hey, how are you
+    today?" is entirely routine while "hey, my mum is in hospital" is not. A
+    canned reply is served when the confidence reaches ``threshold`` and the
+    message has at most ``max_words`` words; anything else goes to the model.
+    Canned replies are counted here; callers :meth:`record` which tier
+    answered the rest once they know.
+    """
+
+    def __init__(self, matcher, replies, threshold=0.75, max_words=8):
+        self.matcher = matcher
+        self.replies = replies
+        self.threshold = threshold
+        self.max_words = max_words
+        self._lock = threading.Lock()
+        self._tiers = Counter()
+        self._intents = Counter()
+
+    def classify(self, message):
+        """Return ``(intent, confidence)``; intent is None when no routine intent matched"""
+        word_count, spans = self.matcher.spans(message)
+        if not word_count:
+            return None, 0.0
+        covered = set()
+        for _, start, end in spans:
+            covered.update(range(start, end))
+        # The highest-priority intent that has replies answers
+        answerable = [name for name in self.matcher.names if name in self.replies]
+        found = {name for name, _, _ in spans}
+        intent = next((name for name in answerable if name in found), None)
+        return intent, len(covered) / word_count
+
+    def route(self, message, allow_canned=True):
+        """Return a canned reply for ``message``, or None when the model should answer.
+
+        Pass ``allow_canned=False`` for messages that must reach the model
+        whatever they look like.
+        """
+        if not allow_canned or len(message.split()) > self.max_words:
+            return None
+        intent, confidence = self.classify(message)
+        if intent is None or confidence < self.threshold:
+            return None
+        with self._lock:
+            self._tiers[CANNED] += 1
+            self._intents[intent] += 1
+        return random.choice(self.replies[intent])
+
+    def record(self, tier):
+        """Count a reply the canned tier passed on, served by ``MODEL`` or ``FALLBACK``"""
+        with self._lock:
+            self._tiers[tier] += 1
+
+    def stats(self):
+        with self._lock:
+            total = sum(self._tiers.values())
+            return {
+                'threshold': self.threshold,
+                'max_words': self.max_words,
+                'tiers': {tier: self._tiers[tier] for tier in TIERS},
+                'share': {tier: round(self._tiers[tier] / total, 3) if total else 0.0 for tier in TIERS},
+                'canned_intents': dict(self._intents),
+            }
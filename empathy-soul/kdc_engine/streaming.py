@@ -0,0 +1,57 @@
+import contextlib
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def sse_event(event, data):
+    """Format a server-sent event carrying a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def max_input_tokens(model, tokenizer):
+    """Longest input the encoder has positions for (128 for BlenderBot)"""
+    limit = getattr(getattr(model, 'config', None), 'max_position_embeddings', None)
+    # Tokenizers without a limit report a huge sentinel instead
+    return limit or min(tokenizer.model_max_length, 512)
+
+
+def stream_reply(model, tokenizer, user_input, timeout=60.0, tokenizer_lock=None, **generate_kwargs):
+    """Yield decoded text chunks as ``model.generate`` produces them.
+
+    Generation runs on a background thread feeding a ``TextIteratorStreamer``;
+    an exception raised by ``generate`` is re-raised here once the stream ends.
+    ``tokenizer_lock`` is held while encoding, for tokenizers shared between threads.
+    Streamers cannot follow beam search, so the checkpoint's ``num_beams``
+    (10 for BlenderBot) is overridden with greedy decoding.
+    """
+    from transformers import TextIteratorStreamer
+
+    generate_kwargs['num_beams'] = 1
+
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=timeout)
+    with tokenizer_lock or contextlib.nullcontext():
+        inputs = tokenizer([user_input], return_tensors="pt", truncation=True,
+                           max_length=max_input_tokens(model, tokenizer))
+    errors = []
+
+    def run():
+        import torch
+        try:
+            with torch.no_grad():
+                model.generate(**inputs, streamer=streamer, **generate_kwargs)
+        except Exception as e:
+            logger.exception("Error in streamed generation")
+            errors.append(e)
+            streamer.end()
+
+    worker = threading.Thread(target=run, name="kdc-stream", daemon=True)
+    worker.start()
+    for text in streamer:
+        if text:
+            yield text
+    worker.join()
+    if errors:
+        raise errors[0]
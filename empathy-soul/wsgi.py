@@ -0,0 +1,13 @@
+"""WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+The model is loaded when this module is imported; with ``preload_app`` that
+happens once in the gunicorn master, before the workers are forked.
+Set ``KDC_PRELOAD_MODEL=0`` to load it lazily in each worker instead.
+"""
+import os
+
+from app import init_app
+
+application = init_app(preload_model=os.getenv('KDC_PRELOAD_MODEL', '1') == '1')
@@ -1,15 +1,19 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
-import tempfile
-import uuid
 import logging
 import random
-import json
-from datetime import datetime
+import sys
 
-# For text-to-speech
-import gtts
+# Shared KDC helpers live at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)))
+from kdc_common import (
+    AudioJanitor, InFlightFiles, Speech, TTSCache, Transcoder, VisemeTracks, get_backend, get_phonemizer, pending_audio,
+    send_audio
+)
+from audio_bank import AudioBank, canned_responses
+from content import ContentStore
+from retrieval import RetrievalIndex
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,14 +29,18 @@ CORS(app, resources={
     }
 })
 
+# Optionally let a front proxy stream audio bytes ("x-sendfile" or "x-accel")
+app.config['AUDIO_SENDFILE_MODE'] = os.getenv('AUDIO_SENDFILE_MODE', '')
+app.config['AUDIO_ACCEL_PREFIX'] = os.getenv('AUDIO_ACCEL_PREFIX', '/protected-audio')
+
 # Create a temporary directory for audio files
 TEMP_DIR = "temp_audio"
 if not os.path.exists(TEMP_DIR):
     os.makedirs(TEMP_DIR)
 
-# Load conversation data from JSON file if available
+# Built-in responses; conversation_data.json overrides and extends them
 CONVERSATION_DATA_FILE = "conversation_data.json"
-conversation_data = {
+default_conversation_data = {
     "greetings": [
         "Hello! How can I help you today?",
         "Hi there! I'm here to assist you. What's on your mind?",
@@ -90,69 +98,173 @@ conversation_data = {
     ]
 }
 
-# Check if data file exists and load it
-if os.path.exists(CONVERSATION_DATA_FILE):
-    try:
-        with open(CONVERSATION_DATA_FILE, 'r') as f:
-            loaded_data = json.load(f)
-            conversation_data.update(loaded_data)
-            logger.info(f"Loaded conversation data from {CONVERSATION_DATA_FILE}")
-    except Exception as e:
-        logger.error(f"Error loading conversation data: {e}")
+# Every response embedded once into a memory-mapped matrix; only responses
+# added to conversation_data.json since the last run are embedded again
+retrieval_index = RetrievalIndex(
+    os.getenv('RETRIEVAL_INDEX_DIR', 'retrieval_index'),
+    dim=int(os.getenv('RETRIEVAL_DIM', '2048'))
+)
+
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '3'))
+# Below this cosine similarity a retrieved response is no better than a fallback
+RETRIEVAL_MIN_SCORE = float(os.getenv('RETRIEVAL_MIN_SCORE', '0.2'))
+# Small talk is answered from these by the rules, never retrieved for other messages
+CONVERSATIONAL_CATEGORIES = {"greetings", "farewells", "self_intro", "fallback_responses"}
+
+def closest_response(content, category, user_input):
+    """Pick among the responses in category that are closest to the message"""
+    matches = content.search(user_input, RETRIEVAL_TOP_K, categories={category})
+    if matches:
+        return random.choice(matches)[2]
+    return random.choice(content.responses[category])
+
+def retrieved_response(content, user_input):
+    """Return the best topical response for the message, or None if nothing is close"""
+    topical = set(content.responses) - CONVERSATIONAL_CATEGORIES
+    matches = content.search(user_input, RETRIEVAL_TOP_K, categories=topical)
+    matches = [match for match in matches if match[0] >= RETRIEVAL_MIN_SCORE]
+    if not matches:
+        return None
+    return random.choice(matches)[2]
+
+# Terms per reply category, highest priority first, compiled into one matcher
+# together with any "intent_terms" in conversation_data.json.
+# Terms match whole words; "*" matches any word ending
+INTENT_TERMS = [
+    ("greetings", ["hello", "hi", "hey", "greetings", "good morning", "good afternoon", "good evening"]),
+    ("farewells", ["goodbye", "bye", "see you", "talk to you later", "farewell"]),
+    ("self_intro", ["who are you", "what are you", "what is your name", "what's your name", "tell me about yourself"]),
+    ("anxiety_responses", ["anxiety", "anxious", "worried", "nervous", "stress*", "panic*", "fear*", "afraid"]),
+    ("depression_responses", ["depress*", "sad", "unhappy", "miserable", "down", "blue", "hopeless", "worthless",
+                              "tired", "exhausted"]),
+    ("meditation_responses", ["meditat*", "mindful*", "breathing", "relax*", "calm*", "peace*", "zen", "yoga"]),
+    ("question", ["how", "what"]),
+    ("general_wellbeing", ["feel better", "improve*", "health*", "wellness", "well-being", "self-care"]),
+]
+
+# conversation_data.json is watched and swapped in whole when it changes;
+# KDC_CONTENT_RELOAD_SECONDS=0 only reads it at startup
+content_store = ContentStore(
+    CONVERSATION_DATA_FILE,
+    default_conversation_data,
+    INTENT_TERMS,
+    retrieval_index,
+    required=["greetings", "farewells", "self_intro", "fallback_responses"],
+    interval=float(os.getenv('KDC_CONTENT_RELOAD_SECONDS', '2'))
+)
+
+def match_intent(user_input, content=None):
+    """Return the reply category the rules pick for a message, or None"""
+    content = content or content_store.snapshot
+    intents = content.matcher.match(user_input)
+    for intent in intents:
+        if intent == "question":
+            continue
+        # Well-being tips only answer questions about well-being practices
+        if intent == "general_wellbeing" and "question" not in intents:
+            continue
+        return intent
+    return None
 
 # Enhanced response generation with more context awareness
 def generate_response(user_input):
     logger.info(f"Generating response for: {user_input}")
-    user_input = user_input.lower()
-    
-    # Track conversation context
-    # Greeting detection
-    if any(greeting in user_input for greeting in ["hello", "hi", "hey", "greetings", "good morning", "good afternoon", "good evening"]):
-        return random.choice(conversation_data["greetings"])
+    # One snapshot for the whole reply, even if the data is reloaded meanwhile
+    content = content_store.snapshot
+    category = match_intent(user_input, content)
     
-    # Farewell detection
-    if any(farewell in user_input for farewell in ["goodbye", "bye", "see you", "talk to you later", "farewell"]):
-        return random.choice(conversation_data["farewells"])
+    # Small talk: any reply in the category fits
+    if category in ("greetings", "farewells", "self_intro"):
+        return random.choice(content.responses[category])
     
-    # Self-introduction
-    if any(intro_q in user_input for intro_q in ["who are you", "what are you", "what is your name", "what's your name", "tell me about yourself"]):
-        return random.choice(conversation_data["self_intro"])
+    # Topical: prefer the replies closest to what was said
+    if category:
+        return closest_response(content, category, user_input)
     
-    # Anxiety related
-    if any(anxiety_term in user_input for anxiety_term in ["anxiety", "anxious", "worried", "nervous", "stress", "stressed", "panic", "fear", "afraid"]):
-        return random.choice(conversation_data["anxiety_responses"])
-    
-    # Depression related
-    if any(depression_term in user_input for depression_term in ["depress", "sad", "unhappy", "miserable", "down", "blue", "hopeless", "worthless", "tired", "exhausted"]):
-        return random.choice(conversation_data["depression_responses"])
-    
-    # Meditation related
-    if any(meditation_term in user_input for meditation_term in ["meditat", "mindful", "breathing", "relax", "calm", "peace", "zen", "yoga"]):
-        return random.choice(conversation_data["meditation_responses"])
-    
-    # Check for questions about well-being practices
-    if ("how" in user_input or "what" in user_input) and any(wellbeing_term in user_input for wellbeing_term in ["feel better", "improve", "health", "wellness", "wellbeing", "self-care", "self care", "mental health"]):
-        return random.choice(conversation_data["general_wellbeing"])
+    # No rule matched: answer with the closest topical response, if any is close
+    retrieved = retrieved_response(content, user_input)
+    if retrieved:
+        return retrieved
     
     # If no specific category is detected, use fallback responses
-    return random.choice(conversation_data["fallback_responses"])
+    return random.choice(content.responses["fallback_responses"])
 
-def text_to_speech(text):
-    # Generate unique filename
-    audio_file = os.path.join(TEMP_DIR, f"{str(uuid.uuid4())}.mp3")
-    
-    try:
-        # Use gTTS for text-to-speech conversion
-        tts = gtts.gTTS(text=text, lang='en', slow=False)
-        tts.save(audio_file)
-        logger.info(f"Created audio file with gTTS: {audio_file}")
-    except Exception as e:
-        logger.error(f"Error generating speech: {e}")
-        # Create fallback empty file in case of error
-        with open(audio_file, 'wb') as f:
-            f.write(b"")
-    
-    return audio_file
+# Text-to-speech engine: "gtts" (default, online), "espeak" or "pyttsx3" (offline)
+tts_backend = get_backend(os.getenv('TTS_BACKEND', 'gtts'), os.getenv('TTS_VOICE') or None)
+TTS_VOICE = tts_backend.voice_id
+logger.info(f"Using TTS backend: {TTS_VOICE}")
+
+# Split replies into sentences rendered in parallel so playback can start early
+TTS_CHUNKED = os.getenv('TTS_CHUNKED', '0') == '1'
+
+def synthesize_speech(text, lang, voice, path):
+    # voice is part of the cache key; the backend already knows which voice to use
+    tts_backend.synthesize(text, lang, path)
+
+audio_in_flight = InFlightFiles()
+
+# Keep temp_audio within an age and size budget instead of growing until /cleanup
+audio_janitor = AudioJanitor(
+    TEMP_DIR,
+    audio_in_flight,
+    max_age=float(os.getenv('TEMP_AUDIO_MAX_AGE_SECONDS', '3600')),
+    max_bytes=int(os.getenv('TEMP_AUDIO_MAX_MB', '100')) * 1024 * 1024,
+    interval=float(os.getenv('TEMP_AUDIO_SWEEP_SECONDS', '60'))
+)
+
+# Identical replies share one content-addressed audio file
+tts_cache = TTSCache(
+    os.getenv('TTS_CACHE_DIR', 'tts_cache'),
+    synthesize_speech,
+    max_bytes=int(os.getenv('TTS_CACHE_MAX_MB', '256')) * 1024 * 1024,
+    in_flight=audio_in_flight,
+    extension=tts_backend.extension
+)
+
+# Low-bitrate variants (?profile=opus24|mp3-48), encoded once per reply
+transcoder = Transcoder(
+    os.path.join(tts_cache.cache_dir, 'variants'),
+    max_bytes=int(os.getenv('AUDIO_VARIANTS_MAX_MB', '64')) * 1024 * 1024,
+    in_flight=audio_in_flight
+)
+
+# Every canned response is pre-synthesized so /chat can skip TTS entirely
+audio_bank = AudioBank(
+    os.getenv('AUDIO_BANK_DIR', 'audio_bank'),
+    lang='en',
+    voice=TTS_VOICE,
+    extension=tts_backend.extension
+)
+
+def rebuild_audio_bank(content):
+    """Synthesize responses added by a reload; new texts use the TTS cache until then"""
+    audio_bank.build(canned_responses(content.responses), synthesize_speech)
+
+if os.getenv('KDC_AUDIO_BANK_BUILD', '1') == '1':
+    content_store.add_listener(rebuild_audio_bank)
+
+# Lip-sync timelines for the avatar, computed once per audio file (from espeak phonemes if installed)
+viseme_tracks = VisemeTracks(os.path.join(tts_cache.cache_dir, 'visemes'), phonemize=get_phonemizer(tts_backend))
+viseme_janitor = AudioJanitor(
+    viseme_tracks.directory,
+    audio_in_flight,
+    max_age=float(os.getenv('VISEME_MAX_AGE_SECONDS', str(7 * 24 * 3600))),
+    max_bytes=int(os.getenv('VISEME_MAX_MB', '16')) * 1024 * 1024,
+    interval=3600
+)
+
+# Speech is rendered on a bounded pool so /chat can answer with text right away
+speech = Speech(
+    tts_cache,
+    viseme_tracks,
+    TTS_VOICE,
+    bank=audio_bank,
+    workers=int(os.getenv('TTS_WORKERS', '4')),
+    wait_seconds=float(os.getenv('AUDIO_WAIT_SECONDS', '15')),
+    fallback_dir=TEMP_DIR,
+    mimetype=tts_backend.mimetype
+)
+audio_jobs = speech.jobs
 
 @app.route('/chat', methods=['POST'])
 def chat():
@@ -169,13 +281,13 @@ def chat():
         response_text = generate_response(user_message)
         logger.info(f"Generated response: {response_text}")
         
-        # Generate speech
-        audio_file = text_to_speech(response_text)
-        
-        return jsonify({
-            'text': response_text,
-            'audio_url': f'/audio/{os.path.basename(audio_file)}'
-        })
+        # Speech is generated in the background; the audio URL resolves once ready
+        chunked = data.get('chunked', TTS_CHUNKED)
+        if chunked:
+            audio_filenames = speech.schedule_chunks(response_text)
+        else:
+            audio_filenames = [speech.schedule(response_text)]
+        return jsonify({'text': response_text, **speech.payload(audio_filenames, chunked=chunked)})
     
     except Exception as e:
         logger.exception("Error in chat endpoint")
@@ -185,24 +297,41 @@ def chat():
 def serve_audio(filename):
     try:
         logger.info(f"Serving audio file: {filename}")
-        return send_file(
-            os.path.join(TEMP_DIR, filename),
-            mimetype='audio/mp3'
-        )
+        pending = pending_audio(speech, filename)
+        if pending:
+            return pending
+        
+        audio_path, content_key, mimetype = speech.resolve(filename)
+        if content_key:
+            audio_path, content_key, mimetype = transcoder.negotiate(
+                audio_path, content_key, mimetype, request.args.get('profile')
+            )
+        return send_audio(audio_path, audio_in_flight, mimetype, content_key=content_key)
     except Exception as e:
         logger.exception(f"Error serving audio file: {filename}")
         return jsonify({'error': str(e)}), 404
 
+@app.route('/lipsync/<filename>')
+def serve_lipsync(filename):
+    try:
+        pending = pending_audio(speech, filename)
+        if pending:
+            return pending
+        
+        track = viseme_tracks.load(filename)
+        if track is None:
+            return jsonify({'error': 'No lip-sync track for this audio'}), 404
+        return jsonify(track)
+    except Exception as e:
+        logger.exception(f"Error serving lip-sync track: {filename}")
+        return jsonify({'error': str(e)}), 500
+
 # Cleanup old audio files
 @app.route('/cleanup', methods=['POST'])
 def cleanup():
     try:
-        count = 0
-        for file in os.listdir(TEMP_DIR):
-            file_path = os.path.join(TEMP_DIR, file)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
-                count += 1
+        # Sweep expired files now; anything still being downloaded is kept
+        count = audio_janitor.sweep()
         logger.info(f"Cleaned up {count} files")
         return jsonify({'message': f'Cleanup successful, removed {count} files'})
     except Exception as e:
@@ -211,8 +340,41 @@ def cleanup():
 
 @app.route('/ping', methods=['GET'])
 def ping():
-    return jsonify({'status': 'ok', 'message': 'KDC Chatbot backend is running'})
+    return jsonify({
+        'status': 'ok',
+        'message': 'KDC Chatbot backend is running',
+        'tts_backend': TTS_VOICE,
+        'tts_cache': tts_cache.stats(),
+        'audio_bank': audio_bank.stats(),
+        'retrieval_index': retrieval_index.stats(),
+        'conversation_data': content_store.stats(),
+        'audio_jobs': audio_jobs.stats(),
+        'temp_audio': audio_janitor.stats(),
+        'audio_variants': transcoder.stats()
+    })
+
+@app.before_request
+def start_background_work():
+    audio_janitor.start()
+    viseme_janitor.start()
+    content_store.start()
+
+def init_app(prebuild_audio_bank=False):
+    """Fill in the audio bank and return the app, ready to serve.
+
+    By default the bank is built in the background. A pre-fork server passes
+    prebuild_audio_bank so the master synthesizes it once before forking and
+    every worker starts with the complete bank (see gunicorn.conf.py and wsgi.py).
+    """
+    if os.getenv('KDC_AUDIO_BANK_BUILD', '1') == '1':
+        responses = content_store.snapshot.responses
+        if prebuild_audio_bank:
+            audio_bank.build(canned_responses(responses), synthesize_speech)
+        else:
+            audio_bank.build_in_background(canned_responses(responses), synthesize_speech)
+    return app
 
 if __name__ == '__main__':
     logger.info("Starting KDC Chatbot backend on port 5000")
-    app.run(debug=True, port=5000, threaded=True)
\ No newline at end of file
+    # Development server; in production run `gunicorn -c gunicorn.conf.py wsgi:application`
+    init_app().run(debug=os.getenv('FLASK_DEBUG', '1') == '1', port=5000, threaded=True)
\ No newline at end of file
@@ -0,0 +1,233 @@
+"""ASGI entry point serving the KDC API from an asyncio event loop.
+
+    uvicorn asgi:application --port 5000
+
+Serves the same ``/chat``, ``/audio/<filename>``, ``/lipsync/<filename>``,
+``/cleanup`` and ``/ping`` endpoints as ``app.py`` and shares its state
+(conversation data, TTS cache, audio bank, render pool). No request holds a
+thread while it waits:
+
+- speech is rendered on the ``TTS_WORKERS`` pool and ``/audio`` long-polls
+  are woken by a callback when their job finishes, rather than each blocking
+  a thread on the render;
+- audio files and lip-sync tracks are read with async file I/O;
+- filesystem work that has no async form (scheduling speech, transcoding,
+  sweeping) runs on anyio's worker threads, which are capped at 40.
+
+One process can therefore keep thousands of chats and pending audio
+requests open. ``AUDIO_SENDFILE_MODE`` only applies to the WSGI app.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+
+import anyio
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, JSONResponse, Response
+from starlette.routing import Route
+
+from app import (
+    TTS_CHUNKED, TTS_VOICE, audio_bank, audio_in_flight, audio_janitor, content_store, generate_response,
+    init_app, retrieval_index, speech, transcoder, tts_cache, viseme_janitor, viseme_tracks
+)
+from kdc_common.delivery import IMMUTABLE_MAX_AGE
+from kdc_common.tts_cache import CLAIM_POLL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class TrackedFileResponse(FileResponse):
+    """File response that keeps the janitor away from its file until the body is sent"""
+
+    async def __call__(self, scope, receive, send):
+        # Released even when the client disconnects mid-transfer
+        held = audio_in_flight.acquire(self.path)
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            audio_in_flight.release(held)
+
+
+async def wait_for_job(filename, timeout):
+    """Wait up to ``timeout`` seconds for a pending render; True once it is finished"""
+    loop = asyncio.get_running_loop()
+    finished = asyncio.Event()
+    # Called on the render thread
+    if not speech.jobs.on_done(filename, lambda: loop.call_soon_threadsafe(finished.set)):
+        # Rendering in another worker process, if at all; watch the shared cache
+        deadline = loop.time() + timeout
+        while speech.status(filename) == 'pending':
+            if loop.time() >= deadline:
+                return False
+            await asyncio.sleep(CLAIM_POLL_SECONDS)
+        return True
+    try:
+        await asyncio.wait_for(finished.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+async def wait_for_audio(request, filename):
+    """Async counterpart of ``kdc_common.pending_audio``"""
+    if speech.status(filename) == 'pending':
+        try:
+            wait = speech.wait_time(float(request.query_params['wait']))
+        except (KeyError, ValueError):
+            wait = speech.wait_time()
+        if not await wait_for_job(filename, wait):
+            return JSONResponse({'status': 'pending'}, status_code=202, headers={'Retry-After': '1'})
+
+    if speech.status(filename) == 'failed':
+        return JSONResponse({'error': 'Audio generation failed'}, status_code=500)
+    return None
+
+
+async def load_track(filename):
+    """Read the lip-sync track for an audio file, or None if there is none yet"""
+    try:
+        return json.loads(await anyio.Path(viseme_tracks.path_for(filename)).read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def send_audio(request, path, mimetype, content_key=None):
+    """Stream an audio file; content-addressed files get a strong ETag and a year of caching"""
+    headers = {'Accept-Ranges': 'bytes'}
+    if content_key:
+        etag = f'"{content_key}"'
+        headers['ETag'] = etag
+        headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        if etag in request.headers.get('if-none-match', ''):
+            return Response(status_code=304, headers=headers)
+    else:
+        headers['Cache-Control'] = 'no-cache'
+    if not os.path.isfile(path):
+        return JSONResponse({'error': 'Audio file not found'}, status_code=404)
+    return TrackedFileResponse(path, media_type=mimetype, headers=headers)
+
+
+def speech_payload(text, chunked):
+    audio_filenames = speech.schedule_chunks(text) if chunked else [speech.schedule(text)]
+    return speech.payload(audio_filenames, chunked=chunked)
+
+
+async def chat(request):
+    try:
+        data = await request.json()
+        logger.info(f"Received data: {data}")
+        user_message = data.get('message', '')
+
+        if not user_message:
+            logger.error("No message provided")
+            return JSONResponse({'error': 'No message provided'}, status_code=400)
+
+        response_text = generate_response(user_message)
+        logger.info(f"Generated response: {response_text}")
+
+        # Rendering itself runs on the TTS pool; this only checks the bank and cache
+        chunked = data.get('chunked', TTS_CHUNKED)
+        payload = await anyio.to_thread.run_sync(speech_payload, response_text, chunked)
+        return JSONResponse({'text': response_text, **payload})
+
+    except Exception as e:
+        logger.exception("Error in chat endpoint")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def serve_audio(request):
+    filename = os.path.basename(request.path_params['filename'])
+    try:
+        pending = await wait_for_audio(request, filename)
+        if pending:
+            return pending
+
+        audio_path, content_key, mimetype = speech.resolve(filename)
+        if content_key:
+            # Transcoding runs ffmpeg; keep it off the event loop
+            audio_path, content_key, mimetype = await anyio.to_thread.run_sync(
+                transcoder.negotiate, audio_path, content_key, mimetype, request.query_params.get('profile')
+            )
+        return send_audio(request, audio_path, mimetype, content_key)
+    except Exception as e:
+        logger.exception(f"Error serving audio file: {filename}")
+        return JSONResponse({'error': str(e)}, status_code=404)
+
+
+async def serve_lipsync(request):
+    filename = os.path.basename(request.path_params['filename'])
+    try:
+        pending = await wait_for_audio(request, filename)
+        if pending:
+            return pending
+
+        track = await load_track(filename)
+        if track is None:
+            return JSONResponse({'error': 'No lip-sync track for this audio'}, status_code=404)
+        return JSONResponse(track)
+    except Exception as e:
+        logger.exception(f"Error serving lip-sync track: {filename}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def cleanup(request):
+    try:
+        count = await anyio.to_thread.run_sync(audio_janitor.sweep)
+        logger.info(f"Cleaned up {count} files")
+        return JSONResponse({'message': f'Cleanup successful, removed {count} files'})
+    except Exception as e:
+        logger.exception("Error in cleanup endpoint")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def ping(request):
+    return JSONResponse({
+        'status': 'ok',
+        'message': 'KDC Chatbot backend is running',
+        'server': 'asgi',
+        'tts_backend': TTS_VOICE,
+        'tts_cache': tts_cache.stats(),
+        'audio_bank': audio_bank.stats(),
+        'retrieval_index': retrieval_index.stats(),
+        'conversation_data': content_store.stats(),
+        'audio_jobs': speech.stats(),
+        'temp_audio': audio_janitor.stats(),
+        'audio_variants': transcoder.stats()
+    })
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Audio bank build and background threads start once the server is up
+    init_app()
+    audio_janitor.start()
+    viseme_janitor.start()
+    content_store.start()
+    yield
+    audio_janitor.stop()
+    viseme_janitor.stop()
+    content_store.stop()
+
+
+application = Starlette(
+    routes=[
+        Route('/chat', chat, methods=['POST']),
+        Route('/audio/{filename}', serve_audio, methods=['GET', 'HEAD']),
+        Route('/lipsync/{filename}', serve_lipsync),
+        Route('/cleanup', cleanup, methods=['POST']),
+        Route('/ping', ping),
+    ],
+    middleware=[
+        Middleware(
+            CORSMiddleware,
+            allow_origins=["http://localhost:5173", "http://127.0.0.1:5173"],
+            allow_methods=["GET", "POST", "OPTIONS"],
+            allow_headers=["Content-Type"]
+        )
+    ],
+    lifespan=lifespan
+)
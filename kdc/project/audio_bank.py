@@ -0,0 +1,249 @@
+"""Prebuilt audio for every canned KDC response.
+
+Usage:
+    python audio_bank.py build [--workers N] [--force]
+
+The bank lives in ``AUDIO_BANK_DIR`` (default ``audio_bank/``) and is indexed
+by ``manifest.json``, which maps each response text to its audio file.
+Worker processes sharing the directory build it one at a time: the one
+holding ``build.lock`` synthesizes, the others wait and read its manifest.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)))
+from kdc_common import TTSCache
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+BUILD_LOCK_FILE = "build.lock"
+# A build refreshes its lock after every file; older locks belong to a dead process
+BUILD_LOCK_TTL = 120
+
+
+def canned_responses(conversation_data):
+    """Return every distinct response string in ``conversation_data``"""
+    texts = []
+    seen = set()
+    for responses in conversation_data.values():
+        if not isinstance(responses, list):
+            continue
+        for text in responses:
+            if isinstance(text, str) and text and text not in seen:
+                seen.add(text)
+                texts.append(text)
+    return texts
+
+
+class AudioBank:
+    """Manifest-indexed store of pre-synthesized responses"""
+
+    def __init__(self, bank_dir, lang='en', voice='gtts/com', extension='.mp3'):
+        self.bank_dir = os.path.abspath(bank_dir)
+        self.lang = lang
+        self.voice = voice
+        self.extension = extension
+        self._build_lock = threading.Lock()
+        self._entries = {}
+        os.makedirs(bank_dir, exist_ok=True)
+        self._entries = self._read_manifest()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.bank_dir, MANIFEST_FILE)
+
+    def lookup(self, text):
+        """Return the path of the prebuilt audio for ``text``, or None"""
+        filename = self._entries.get(text)
+        if filename is None:
+            return None
+        return os.path.join(self.bank_dir, filename)
+
+    def path_for(self, filename):
+        """Return the on-disk path of a bank file, or None if it is not in the bank"""
+        filename = os.path.basename(filename)
+        path = os.path.join(self.bank_dir, filename)
+        if not filename.endswith(self.extension) or not os.path.isfile(path):
+            return None
+        return path
+
+    def build(self, texts, synthesize, workers=4, force=False):
+        """Synthesize any of ``texts`` missing from the bank and rewrite the manifest.
+
+        Files for texts that are no longer present are removed by the next
+        build. If another process is already building the bank this waits for
+        it and loads its manifest instead. Returns the number of newly
+        synthesized files.
+        """
+        with self._build_lock:
+            if not self._claim_build():
+                # Every worker sees the same change; one synthesis is enough
+                while self._build_claimed():
+                    time.sleep(0.5)
+                self._entries = self._read_manifest()
+                return 0
+            try:
+                return self._build(texts, synthesize, workers, force)
+            finally:
+                self._release_build()
+
+    def build_in_background(self, texts, synthesize, workers=4):
+        """Run :meth:`build` on a daemon thread so startup is not delayed"""
+        thread = threading.Thread(
+            target=self.build,
+            args=(texts, synthesize),
+            kwargs={'workers': workers},
+            name="kdc-audio-bank",
+            daemon=True
+        )
+        thread.start()
+        return thread
+
+    def stats(self):
+        return {'entries': len(self._entries)}
+
+    def _build(self, texts, synthesize, workers, force):
+        entries = {}
+        pending = []
+        for text in texts:
+            filename = TTSCache.key_for(text, self.lang, self.voice) + self.extension
+            entries[text] = filename
+            path = os.path.join(self.bank_dir, filename)
+            if force or not os.path.isfile(path) or os.path.getsize(path) == 0:
+                pending.append((text, path))
+
+        def render(item):
+            text, path = item
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            try:
+                synthesize(text, self.lang, self.voice, tmp_path)
+                os.replace(tmp_path, path)
+                self._refresh_build()
+                return True
+            except Exception as e:
+                logger.error(f"Error pre-synthesizing response: {e}")
+                return False
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        built = 0
+        if pending:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                built = sum(pool.map(render, pending))
+
+        # Only index files that actually exist so lookups never miss on disk
+        entries = {text: filename for text, filename in entries.items()
+                   if os.path.isfile(os.path.join(self.bank_dir, filename))}
+        if not pending and not force and entries == self._read_manifest():
+            # Another worker already built this version of the bank
+            self._entries = entries
+            return 0
+        previous = self._entries
+        self._write_manifest(entries)
+        self._entries = entries
+        # Files dropped from the previous manifest outlive one build so
+        # replies already sent with their URLs can still be played
+        self._prune(set(entries.values()) | set(previous.values()))
+
+        logger.info(f"Audio bank ready: {len(entries)} responses, {built} newly synthesized")
+        return built
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.error(f"Error reading audio bank manifest: {e}")
+            return {}
+        if manifest.get('lang') != self.lang or manifest.get('voice') != self.voice:
+            return {}
+        return {text: filename for text, filename in manifest.get('entries', {}).items()
+                if os.path.isfile(os.path.join(self.bank_dir, filename))}
+
+    def _write_manifest(self, entries):
+        tmp_path = f"{self.manifest_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'lang': self.lang, 'voice': self.voice, 'entries': entries}, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _prune(self, keep):
+        for name in os.listdir(self.bank_dir):
+            # Temporary files may belong to a write in progress elsewhere
+            if name in (MANIFEST_FILE, BUILD_LOCK_FILE) or name in keep or name.endswith('.tmp'):
+                continue
+            try:
+                os.remove(os.path.join(self.bank_dir, name))
+            except OSError:
+                pass
+
+    @property
+    def _build_lock_path(self):
+        return os.path.join(self.bank_dir, BUILD_LOCK_FILE)
+
+    def _claim_build(self):
+        """Take the cross-process build lock; False if another process holds it"""
+        try:
+            os.close(os.open(self._build_lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            pass
+        if not self._build_claimed():
+            # Left behind by a build that died; take it over on this call
+            self._release_build()
+            return self._claim_build()
+        return False
+
+    def _build_claimed(self):
+        try:
+            claimed_at = os.path.getmtime(self._build_lock_path)
+        except OSError:
+            return False
+        return time.time() - claimed_at < BUILD_LOCK_TTL
+
+    def _refresh_build(self):
+        try:
+            os.utime(self._build_lock_path)
+        except OSError:
+            pass
+
+    def _release_build(self):
+        try:
+            os.remove(self._build_lock_path)
+        except FileNotFoundError:
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the KDC prebuilt audio bank")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help="Pre-synthesize every canned response")
+    build_parser.add_argument('--workers', type=int, default=4, help="Parallel synthesis jobs")
+    build_parser.add_argument('--force', action='store_true', help="Re-synthesize existing files")
+    args = parser.parse_args(argv)
+
+    # Reuse the backend's conversation data and TTS settings
+    import app
+
+    built = app.audio_bank.build(
+        canned_responses(app.content_store.snapshot.responses),
+        app.synthesize_speech,
+        workers=args.workers,
+        force=args.force
+    )
+    print(f"Synthesized {built} files; bank holds {app.audio_bank.stats()['entries']} responses")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,141 @@
+"""Compare the compiled intent matcher against the old substring if-chain.
+
+Usage:
+    python benchmarks/intents.py [--repeat 2000] [--scale 10] [--messages messages.txt] [--show]
+
+Classifies a fixed message set with ``match_intent`` (one pass over the
+message's words) and with a copy of the cascaded ``in`` scans it replaced,
+and reports the time per message for each. Messages the two classify
+differently are counted; most are substring false hits of the old chain,
+such as "hi" inside "this" or "down" inside "download".
+
+The chain costs one substring scan per term, the matcher one lookup per
+word, so the run is repeated with ``--scale`` times as many terms per intent
+(padded with terms that never match) to show how each grows with the term
+lists.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MESSAGES = [
+    "hello there",
+    "this is a hard week for me",
+    "I feel anxious about my exams",
+    "I've been so stressed at work lately",
+    "I'm depressed and everything feels heavy",
+    "I downloaded a meditation app yesterday",
+    "how can I improve my mental health?",
+    "what should I do to feel better",
+    "goodbye, thanks for listening",
+    "who are you exactly?",
+    "my partner and I keep arguing about money",
+    "I'm afraid of being alone",
+    "can you recommend some yoga for beginners",
+    "nothing much, just thinking about things",
+    "I have been so tired and exhausted all week",
+    "my therapist said I should try mindfulness",
+    "see you tomorrow",
+    "what's your name",
+    "I lost my job and I don't know what to do next",
+    "the weather is lovely and I feel at peace",
+]
+
+
+def legacy_intent(user_input):
+    """The substring if-chain match_intent replaced"""
+    user_input = user_input.lower()
+    if any(greeting in user_input for greeting in ["hello", "hi", "hey", "greetings", "good morning", "good afternoon", "good evening"]):
+        return "greetings"
+    if any(farewell in user_input for farewell in ["goodbye", "bye", "see you", "talk to you later", "farewell"]):
+        return "farewells"
+    if any(intro_q in user_input for intro_q in ["who are you", "what are you", "what is your name", "what's your name", "tell me about yourself"]):
+        return "self_intro"
+    if any(anxiety_term in user_input for anxiety_term in ["anxiety", "anxious", "worried", "nervous", "stress", "stressed", "panic", "fear", "afraid"]):
+        return "anxiety_responses"
+    if any(depression_term in user_input for depression_term in ["depress", "sad", "unhappy", "miserable", "down", "blue", "hopeless", "worthless", "tired", "exhausted"]):
+        return "depression_responses"
+    if any(meditation_term in user_input for meditation_term in ["meditat", "mindful", "breathing", "relax", "calm", "peace", "zen", "yoga"]):
+        return "meditation_responses"
+    if ("how" in user_input or "what" in user_input) and any(wellbeing_term in user_input for wellbeing_term in ["feel better", "improve", "health", "wellness", "wellbeing", "self-care", "self care", "mental health"]):
+        return "general_wellbeing"
+    return None
+
+
+def chain_intent(intents, user_input):
+    """First intent with a term contained in the message, as the old chain did"""
+    user_input = user_input.lower()
+    for name, terms in intents:
+        if any(term in user_input for term in terms):
+            return name
+    return None
+
+
+def scaled_terms(intents, scale):
+    """``intents`` with every term list padded to ``scale`` times its length"""
+    scaled = []
+    for name, terms in intents:
+        padding = [f"{name[:4]}{i:04d}zq" for i in range(len(terms) * (scale - 1))]
+        scaled.append((name, list(terms) + padding))
+    return scaled
+
+
+def time_per_message(classify, messages, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            classify(message)
+    return (time.perf_counter() - started) / (repeat * len(messages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=2000, help="Passes over the message set")
+    parser.add_argument('--scale', type=int, default=10, help="Term-list multiplier for the scaling run")
+    parser.add_argument('--messages', help="File with one message per line (defaults to a built-in set)")
+    parser.add_argument('--show', action='store_true', help="Print messages the two classify differently")
+    args = parser.parse_args()
+    messages = MESSAGES
+    if args.messages:
+        with open(args.messages, 'r') as f:
+            messages = [line.strip() for line in f if line.strip()]
+
+    # The app creates its audio and index directories in the working directory
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        import app
+        from kdc_common import IntentMatcher
+
+        rows = []
+        term_count = sum(len(terms) for _, terms in app.INTENT_TERMS)
+        rows.append(('if-chain', term_count, time_per_message(legacy_intent, messages, args.repeat)))
+        rows.append(('matcher', term_count, time_per_message(app.match_intent, messages, args.repeat)))
+
+        scaled = scaled_terms(app.INTENT_TERMS, args.scale)
+        substrings = [(name, [term.rstrip('*') for term in terms]) for name, terms in scaled]
+        matcher = IntentMatcher(scaled)
+        term_count = sum(len(terms) for _, terms in scaled)
+        rows.append(('if-chain', term_count,
+                     time_per_message(lambda message: chain_intent(substrings, message), messages, args.repeat)))
+        rows.append(('matcher', term_count, time_per_message(matcher.first, messages, args.repeat)))
+
+    differences = [(message, legacy_intent(message), app.match_intent(message)) for message in messages]
+    differences = [item for item in differences if item[1] != item[2]]
+    if args.show:
+        for message, old, new in differences:
+            print(f"> {message}\n  if-chain: {old}\n  matcher:  {new}\n")
+
+    print(f"{'classifier':<10} {'terms':>6} {'us/message':>11}")
+    for label, terms, seconds in rows:
+        print(f"{label:<10} {terms:>6} {seconds * 1e6:11.2f}")
+    print()
+    print(f"speedup:             {rows[0][2] / rows[1][2]:.2f}x ({args.scale}x terms: {rows[2][2] / rows[3][2]:.2f}x)")
+    print(f"different intents:   {len(differences)}/{len(messages)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""Hot-reloadable conversation data for the KDC backend.
+
+``conversation_data.json`` is polled for changes by a watcher thread. A
+changed file is validated, the intent matcher and retrieval vectors are
+rebuilt on that thread, and the result is published as one immutable
+:class:`ContentSnapshot`. A request reads ``store.snapshot`` once and uses
+only that object, so it never mixes responses, terms and vectors from two
+versions of the file. A file that fails to parse or validate is logged and
+the current snapshot stays in place.
+
+Besides response lists the file may hold ``"intent_terms"``, a mapping of
+category to extra matcher terms, so the keyword rules can reach categories
+added to the file without a code change.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)))
+from kdc_common import IntentMatcher
+
+logger = logging.getLogger(__name__)
+
+INTENT_TERMS_KEY = "intent_terms"
+
+
+class ContentError(ValueError):
+    """The conversation data is malformed"""
+
+
+def parse(data, defaults, required=()):
+    """Merge file ``data`` over ``defaults`` and return ``(responses, intent_terms)``.
+
+    Raises ``ContentError`` when a category is not a non-empty list of
+    strings, when extra terms name a category without responses, or when
+    a ``required`` category ends up missing.
+    """
+    if not isinstance(data, dict):
+        raise ContentError("expected an object mapping categories to response lists")
+    responses = dict(defaults)
+    for category, texts in data.items():
+        if category == INTENT_TERMS_KEY:
+            continue
+        if not isinstance(texts, list) or not texts:
+            raise ContentError(f"category {category!r} must be a non-empty list of responses")
+        if not all(isinstance(text, str) and text.strip() for text in texts):
+            raise ContentError(f"category {category!r} has an empty or non-string response")
+        responses[category] = list(texts)
+
+    missing = [category for category in required if not responses.get(category)]
+    if missing:
+        raise ContentError(f"missing required categories: {', '.join(missing)}")
+
+    intent_terms = data.get(INTENT_TERMS_KEY, {})
+    if not isinstance(intent_terms, dict):
+        raise ContentError(f"{INTENT_TERMS_KEY!r} must map categories to term lists")
+    for category, terms in intent_terms.items():
+        if category not in responses:
+            raise ContentError(f"{INTENT_TERMS_KEY!r} names category {category!r}, which has no responses")
+        if not isinstance(terms, list) or not all(isinstance(term, str) and term.strip() for term in terms):
+            raise ContentError(f"terms for {category!r} must be a list of non-empty strings")
+    return responses, {category: list(terms) for category, terms in intent_terms.items()}
+
+
+class ContentSnapshot:
+    """One version of the conversation data and everything derived from it"""
+
+    __slots__ = ('version', 'responses', 'matcher', 'loaded_at', '_index', '_index_state')
+
+    def __init__(self, version, responses, matcher, index, index_state):
+        self.version = version
+        self.responses = responses
+        self.matcher = matcher
+        self.loaded_at = time.time()
+        self._index = index
+        self._index_state = index_state
+
+    def search(self, query, k=3, categories=None):
+        """Search the retrieval index as it was built for this snapshot"""
+        return self._index.search(query, k, categories, state=self._index_state)
+
+
+class ContentStore:
+    """Current :class:`ContentSnapshot` of a conversation data file, reloaded on change.
+
+    ``intent_terms`` are the built-in ``(category, terms)`` pairs, highest
+    priority first; terms from the file extend them and categories only the
+    file knows are matched last. Callbacks added with :meth:`add_listener`
+    run on the reloading thread after each new snapshot is published.
+    """
+
+    def __init__(self, path, defaults, intent_terms, retrieval_index, required=(), interval=2.0):
+        self.path = os.path.abspath(path)
+        self.defaults = defaults
+        self.intent_terms = intent_terms
+        self.retrieval_index = retrieval_index
+        self.required = tuple(required)
+        self.interval = interval
+        self.snapshot = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._thread = None
+        self._stop = threading.Event()
+        self._signature = None
+        self._version = 0
+        self._reloads = 0
+        self._rejected = 0
+        self._last_error = None
+        self._last_reload_ms = 0.0
+        if not self.reload(force=True):
+            # Missing or invalid file: serve the built-in responses
+            self.snapshot = self._build(*parse({}, self.defaults, self.required))
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def start(self):
+        if self.interval > 0 and (self._thread is None or not self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="kdc-content-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def reload(self, force=False):
+        """Publish a new snapshot if the file changed; return True when one was published"""
+        with self._lock:
+            signature = self._file_signature()
+            if signature is None:
+                # Some editors delete the file before writing it again
+                self._signature = None
+                return False
+            if signature == self._signature and not force:
+                return False
+            # Remembered even if the file is rejected, so it is not re-read every poll
+            self._signature = signature
+
+            started = time.monotonic()
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                snapshot = self._build(*parse(data, self.defaults, self.required))
+            except Exception as e:
+                self._rejected += 1
+                self._last_error = str(e)
+                logger.error(f"Keeping current conversation data, {self.path} was rejected: {e}")
+                return False
+            self.snapshot = snapshot
+            self._reloads += 1
+            self._last_error = None
+            self._last_reload_ms = round((time.monotonic() - started) * 1000, 3)
+            logger.info(f"Loaded conversation data from {self.path} (version {snapshot.version}, "
+                        f"{len(snapshot.responses)} categories)")
+
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception:
+                logger.exception("Error in conversation data reload listener")
+        return True
+
+    def stats(self):
+        snapshot = self.snapshot
+        return {
+            'version': snapshot.version,
+            'loaded_at': datetime.fromtimestamp(snapshot.loaded_at).isoformat(timespec='seconds'),
+            'categories': len(snapshot.responses),
+            'responses': sum(len(texts) for texts in snapshot.responses.values()),
+            'reloads': self._reloads,
+            'rejected': self._rejected,
+            'last_error': self._last_error,
+            'last_reload_ms': self._last_reload_ms,
+            'watching': self._thread is not None and self._thread.is_alive(),
+        }
+
+    def _build(self, responses, extra_terms):
+        known = {name for name, _ in self.intent_terms}
+        terms = [(name, list(base) + extra_terms.get(name, [])) for name, base in self.intent_terms]
+        terms += [(name, extra) for name, extra in extra_terms.items() if name not in known]
+        matcher = IntentMatcher(terms)
+        try:
+            self.retrieval_index.update(responses)
+        except Exception as e:
+            # Retrieval degrades to the previous vectors; the rules still work
+            logger.error(f"Error updating retrieval index: {e}")
+        self._version += 1
+        return ContentSnapshot(self._version, responses, matcher, self.retrieval_index,
+                               self.retrieval_index.current())
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Error watching conversation data")
@@ -0,0 +1,16 @@
+"""Gunicorn settings for the KDC backend: gunicorn -c gunicorn.conf.py wsgi:application
+
+The app is imported once in the master, which builds the audio bank before
+the workers are forked, so no worker repeats that synthesis. Each worker runs
+several threads because audio requests may long-poll while speech renders.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', str(min(multiprocessing.cpu_count(), 4))))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+# Long enough for an audio request waiting on AUDIO_WAIT_SECONDS
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+preload_app = True
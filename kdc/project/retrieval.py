@@ -0,0 +1,222 @@
+"""Similarity search over the canned KDC responses.
+
+Every response in ``conversation_data`` is embedded once into a row of a
+float32 matrix saved as ``vectors-<id>.npy`` in ``RETRIEVAL_INDEX_DIR``
+(default ``retrieval_index/``) and memory-mapped by every process serving
+the app. ``manifest.json`` names the current matrix and lists the text and
+category of each row; rows whose text is unchanged are reused when the data
+changes, so only new responses are embedded again.
+
+The embedding is a hashed bag of words, word pairs and character 4-grams.
+It needs no model and no fitting, so a query costs one embedding and one
+matrix-vector product: well under a millisecond for a few thousand responses.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+
+# Bump when embed() changes so stale vectors are never mixed with new ones
+EMBEDDING_VERSION = 1
+
+# Matrices written this recently are never pruned: another process may have
+# just switched the manifest to one and not mapped it yet
+PRUNE_GRACE_SECONDS = 60
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+# Too common to tell responses apart
+STOP_WORDS = frozenset("""
+    a an and are as at be but by can do for from has have i i'm if in is it it's me my of on or so that the
+    this to was we what with you your you're
+""".split())
+
+
+def embed(text, dim):
+    """Return the L2-normalised hashed n-gram embedding of ``text``"""
+    words = [word for word in _WORD.findall(text.lower()) if word not in STOP_WORDS]
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        # Shared 4-grams let "anxious" match "anxiety" and "meditate" match "meditation"
+        padded = f"<{word}>"
+        features.extend(padded[i:i + 4] for i in range(len(padded) - 3))
+
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in features:
+        # crc32, unlike hash(), is the same in every process
+        code = zlib.crc32(feature.encode('utf-8'))
+        vector[code % dim] += 1.0 if code & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def response_rows(conversation_data):
+    """Return ``(category, text)`` for every response in ``conversation_data``"""
+    rows = []
+    seen = set()
+    for category, responses in conversation_data.items():
+        if not isinstance(responses, list):
+            continue
+        for text in responses:
+            if isinstance(text, str) and text and (category, text) not in seen:
+                seen.add((category, text))
+                rows.append((category, text))
+    return rows
+
+
+class RetrievalIndex:
+    """Memory-mapped embedding matrix with vectorized top-k search"""
+
+    def __init__(self, index_dir, dim=2048):
+        self.index_dir = os.path.abspath(index_dir)
+        self.dim = dim
+        self._lock = threading.Lock()
+        # (vectors, category per row, text per row, category code per row,
+        # sorted category names) swapped as one tuple
+        self._searches = 0
+        os.makedirs(self.index_dir, exist_ok=True)
+        self._state = self._load()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.index_dir, MANIFEST_FILE)
+
+    def update(self, conversation_data):
+        """Bring the index in line with ``conversation_data``, embedding only new rows.
+
+        Returns the number of rows that were embedded.
+        """
+        rows = response_rows(conversation_data)
+        with self._lock:
+            # Another worker may already have indexed the same data
+            state = self._load() or self._state
+            known = {}
+            if state is not None:
+                vectors, categories, texts, _, _ = state
+                known = {text: i for i, text in enumerate(texts)}
+                if [category for category, _ in rows] == categories and [text for _, text in rows] == texts:
+                    self._state = state
+                    return 0
+
+            matrix = np.zeros((len(rows), self.dim), dtype=np.float32)
+            embedded = 0
+            for i, (_, text) in enumerate(rows):
+                if text in known:
+                    matrix[i] = vectors[known[text]]
+                else:
+                    matrix[i] = embed(text, self.dim)
+                    embedded += 1
+
+            self._state = self._save(matrix, rows)
+            logger.info(f"Retrieval index ready: {len(rows)} responses, {embedded} newly embedded")
+            return embedded
+
+    def current(self):
+        """Return the current index state, to search a fixed version with ``search(state=...)``"""
+        return self._state
+
+    def search(self, query, k=3, categories=None, state=None):
+        """Return up to ``k`` ``(score, category, text)`` tuples, best first.
+
+        ``categories`` restricts the search to responses in those categories.
+        Scores are cosine similarities in [-1, 1]. ``state`` (from
+        :meth:`current`) searches that version of the index instead of the
+        latest one.
+        """
+        state = self._state if state is None else state
+        if state is None or k <= 0:
+            return []
+        vectors, row_categories, texts, codes, names = state
+        if not texts:
+            return []
+
+        self._searches += 1
+        scores = vectors @ embed(query, self.dim)
+        if categories is not None:
+            allowed = [code for code, name in enumerate(names) if name in categories]
+            scores = np.where(np.isin(codes, allowed), scores, -np.inf)
+        k = min(k, len(texts))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), row_categories[i], texts[i]) for i in top if np.isfinite(scores[i])]
+
+    def stats(self):
+        state = self._state
+        return {
+            'entries': 0 if state is None else len(state[2]),
+            'dim': self.dim,
+            'searches': self._searches,
+        }
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Error reading retrieval index manifest: {e}")
+            return None
+        if manifest.get('version') != EMBEDDING_VERSION or manifest.get('dim') != self.dim:
+            return None
+        try:
+            # Read-only mapping: pages are shared by every worker on the host
+            vectors = np.load(os.path.join(self.index_dir, manifest['vectors']), mmap_mode='r')
+        except Exception as e:
+            logger.error(f"Error mapping retrieval vectors: {e}")
+            return None
+        rows = [(row['category'], row['text']) for row in manifest['rows']]
+        if vectors.shape != (len(rows), self.dim):
+            return None
+        return self._state_for(vectors, rows)
+
+    def _save(self, matrix, rows):
+        filename = f"vectors-{uuid.uuid4().hex}.npy"
+        tmp_path = os.path.join(self.index_dir, f"{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, os.path.join(self.index_dir, filename))
+
+        # The manifest is switched last, so a reader always sees a complete matrix
+        manifest = {
+            'version': EMBEDDING_VERSION,
+            'dim': self.dim,
+            'vectors': filename,
+            'rows': [{'category': category, 'text': text} for category, text in rows],
+        }
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+        vectors = np.load(os.path.join(self.index_dir, filename), mmap_mode='r')
+        self._prune(filename)
+        return self._state_for(vectors, rows)
+
+    def _state_for(self, vectors, rows):
+        categories = [category for category, _ in rows]
+        names = sorted(set(categories))
+        codes = np.array([names.index(category) for category in categories], dtype=np.int32)
+        return vectors, categories, [text for _, text in rows], codes, names
+
+    def _prune(self, keep):
+        # Processes still mapping an old matrix keep reading it after the unlink
+        cutoff = time.time() - PRUNE_GRACE_SECONDS
+        for name in os.listdir(self.index_dir):
+            if name.startswith('vectors-') and name != keep:
+                path = os.path.join(self.index_dir, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,10 @@
+"""WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+With ``preload_app`` this module is imported once in the gunicorn master,
+which fills in the audio bank before the workers are forked.
+"""
+from app import init_app
+
+application = init_app(prebuild_audio_bank=True)
@@ -0,0 +1,17 @@
+"""Helpers shared by the Empathy Soul and KDC companion backends"""
+
+from .audio_jobs import AudioJobs
+from .delivery import pending_audio, send_audio
+from .intents import IntentMatcher
+from .janitor import AudioJanitor, InFlightFiles, send_tracked
+from .speech import Speech
+from .transcode import PROFILES, Transcoder
+from .tts_backends import TTSBackend, get_backend, get_phonemizer, split_sentences
+from .tts_cache import TTSCache
+from .visemes import VisemeTracks, text_to_visemes
+
+__all__ = [
+    'PROFILES', 'AudioJanitor', 'AudioJobs', 'InFlightFiles', 'IntentMatcher', 'Speech', 'TTSBackend', 'TTSCache',
+    'Transcoder', 'VisemeTracks', 'get_backend', 'get_phonemizer', 'pending_audio', 'send_audio', 'send_tracked',
+    'split_sentences', 'text_to_visemes',
+]
@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class _Job:
+    def __init__(self):
+        self.state = PENDING
+        self.error = None
+        self.done = threading.Event()
+        self.finished_at = None
+        # Called once the job finishes; None afterwards
+        self.callbacks = []
+
+
+class AudioJobs:
+    """Bounded worker pool that renders speech off the request thread.
+
+    Jobs are keyed by the audio filename handed to the client, so the audio
+    endpoint can report whether a file is still being rendered. ``render``
+    takes the text and returns the path of the finished file. When more than
+    ``max_pending`` jobs are queued, new work is rendered on the caller's
+    thread instead, which pushes back on bursts rather than queueing forever.
+    """
+
+    def __init__(self, render, max_workers=4, max_pending=256, failed_ttl=300):
+        self.render = render
+        self.max_pending = max_pending
+        self.failed_ttl = failed_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kdc-tts")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._submitted = 0
+        self._inline = 0
+        self._failed = 0
+
+    def submit(self, key, text):
+        """Schedule ``text`` to be rendered under ``key`` unless it already is"""
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(key)
+            if job is not None and job.state != FAILED:
+                return job
+            job = self._jobs[key] = _Job()
+            pending = sum(1 for j in self._jobs.values() if j.state == PENDING)
+            inline = pending > self.max_pending
+            if inline:
+                self._inline += 1
+            else:
+                self._submitted += 1
+
+        if inline:
+            self._run(key, job, text)
+        else:
+            self._executor.submit(self._run, key, job, text)
+        return job
+
+    def status(self, key):
+        """Return ``'pending'``, ``'failed'`` or None when no job is tracked"""
+        with self._lock:
+            job = self._jobs.get(key)
+            return job.state if job is not None else None
+
+    def wait(self, key, timeout):
+        """Block up to ``timeout`` seconds for ``key``; True once it is finished"""
+        with self._lock:
+            job = self._jobs.get(key)
+        if job is None:
+            return True
+        return job.done.wait(timeout)
+
+    def on_done(self, key, callback):
+        """Call ``callback()`` once ``key`` is finished, without blocking a thread.
+
+        Runs it right away if the job already finished; returns False (and
+        does not call it) when no job is tracked for ``key``.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                return False
+            if job.callbacks is not None:
+                job.callbacks.append(callback)
+                return True
+        callback()
+        return True
+
+    def stats(self):
+        with self._lock:
+            pending = sum(1 for j in self._jobs.values() if j.state == PENDING)
+            return {
+                'pending': pending,
+                'submitted': self._submitted,
+                'rendered_inline': self._inline,
+                'failed': self._failed,
+                'max_pending': self.max_pending,
+            }
+
+    def _run(self, key, job, text):
+        try:
+            self.render(text)
+            job.state = READY
+        except Exception as e:
+            logger.error(f"Error generating speech in background: {e}")
+            job.state = FAILED
+            job.error = e
+        finally:
+            job.finished_at = time.monotonic()
+            with self._lock:
+                if job.state == READY and self._jobs.get(key) is job:
+                    # The file is now on disk; nothing left to track
+                    del self._jobs[key]
+                elif job.state == FAILED:
+                    self._failed += 1
+                callbacks, job.callbacks = job.callbacks, None
+            job.done.set()
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception:
+                    logger.exception("Error in audio job callback")
+
+    def _expire(self):
+        # Failed jobs are kept for a while so clients get a definite answer
+        now = time.monotonic()
+        for key in [k for k, j in self._jobs.items()
+                    if j.state == FAILED and now - j.finished_at > self.failed_ttl]:
+            del self._jobs[key]
@@ -0,0 +1,86 @@
+import os
+
+from .janitor import send_tracked
+
+# Content-addressed files never change, so clients may keep them for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+SENDFILE_HEADERS = {
+    'x-sendfile': 'X-Sendfile',
+    'x-accel': 'X-Accel-Redirect',
+}
+
+
+def send_audio(path, in_flight, mimetype, content_key=None, max_age=0):
+    """Send an audio file with Range, ETag and Last-Modified support.
+
+    ``send_file`` answers Range requests with 206 and conditional requests
+    with 304. When ``content_key`` is given the file is content-addressed:
+    the key becomes a strong ETag and the response is cacheable for a year.
+
+    Setting ``AUDIO_SENDFILE_MODE`` in the app config to ``x-sendfile`` or
+    ``x-accel`` hands the transfer to a front proxy instead. For nginx,
+    ``X-Accel-Redirect`` points at ``AUDIO_ACCEL_PREFIX/<dir>/<file>``, which
+    should map to an ``internal`` location aliasing the audio directories.
+    """
+    from flask import current_app, request, send_file
+
+    mode = (current_app.config.get('AUDIO_SENDFILE_MODE') or '').lower()
+    if mode in SENDFILE_HEADERS:
+        accel_prefix = current_app.config.get('AUDIO_ACCEL_PREFIX', '/protected-audio')
+        response = _proxy_response(path, mimetype, content_key, mode, accel_prefix)
+    else:
+        response = send_file(
+            path,
+            mimetype=mimetype,
+            conditional=True,
+            etag=content_key if content_key else True,
+            max_age=IMMUTABLE_MAX_AGE if content_key else max_age
+        )
+    response.headers['Accept-Ranges'] = 'bytes'
+
+    if content_key:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+    else:
+        response.cache_control.no_cache = True
+
+    if mode in SENDFILE_HEADERS:
+        # The proxy streams the bytes; only the validators are needed here
+        response.make_conditional(request)
+        return response
+    return send_tracked(response, path, in_flight)
+
+
+def pending_audio(speech, filename):
+    """Return an early response while ``filename`` is still rendering or has failed, else None"""
+    from flask import jsonify, request
+
+    if speech.status(filename) == 'pending':
+        wait = speech.wait_time(request.args.get('wait', type=float))
+        if not speech.wait(filename, wait):
+            response = jsonify({'status': 'pending'})
+            response.headers['Retry-After'] = '1'
+            return response, 202
+
+    if speech.status(filename) == 'failed':
+        return jsonify({'error': 'Audio generation failed'}), 500
+    return None
+
+
+def _proxy_response(path, mimetype, content_key, mode, accel_prefix):
+    from flask import Response
+
+    stat = os.stat(path)
+    response = Response(mimetype=mimetype)
+    response.last_modified = stat.st_mtime
+    # Same validator as a direct send, so switching modes keeps client caches valid
+    response.set_etag(content_key or f"{int(stat.st_mtime)}-{stat.st_size}")
+    if mode == 'x-sendfile':
+        response.headers['X-Sendfile'] = os.path.abspath(path)
+    else:
+        directory = os.path.basename(os.path.dirname(os.path.abspath(path)))
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{directory}/{os.path.basename(path)}"
+    return response
+
@@ -0,0 +1,122 @@
+import string
+
+# Apostrophes vanish ("can't", "cant" and "can’t" are one word); other
+# punctuation separates words
+_SEPARATORS = {ord(char): ' ' for char in string.punctuation + '“”‘—–…'}
+_SEPARATORS.update({ord("'"): None, ord('’'): None})
+
+
+def _words(text):
+    return text.lower().translate(_SEPARATORS).split()
+
+
+class _Node:
+    """One step of a term: the words that may follow and the intents it completes"""
+
+    __slots__ = ('words', 'stems', 'stem_length', 'intents')
+
+    def __init__(self):
+        self.words = {}
+        # First stem_length letters -> [(stem, node)] for "*" terms
+        self.stems = {}
+        self.stem_length = 0
+        self.intents = ()
+
+
+def _advance(node, word):
+    """Return the nodes ``word`` leads to from ``node``"""
+    children = []
+    child = node.words.get(word)
+    if child is not None:
+        children.append(child)
+    for stem, child in node.stems.get(word[:node.stem_length], ()):
+        if word.startswith(stem):
+            children.append(child)
+    return children
+
+
+class IntentMatcher:
+    """Find every intent mentioned in a message in one pass over its words.
+
+    ``intents`` is a sequence of ``(name, terms)`` pairs, highest priority
+    first. All terms are compiled into one word-level trie, so a message is
+    lowercased and split once and each word costs a dictionary lookup,
+    however many terms there are. Terms match whole words only ("hi" does
+    not match "this"); a trailing ``*`` matches any word ending ("meditat*"
+    matches "meditation"). Apostrophes are ignored and a hyphenated term
+    also matches its parts spaced or joined ("self-harm", "self harm",
+    "selfharm").
+    """
+
+    def __init__(self, intents):
+        self.names = []
+        self._root = _Node()
+        for index, (name, terms) in enumerate(intents):
+            self.names.append(name)
+            for term in terms:
+                stem = term.endswith('*')
+                spaced = _words(term.rstrip('*'))
+                joined = _words(term.rstrip('*').replace('-', ''))
+                for words in {tuple(spaced), tuple(joined)}:
+                    if words:
+                        self._add(words, stem, index)
+
+    def match(self, text):
+        """Return the names of every intent found in ``text``, highest priority first"""
+        found = {index for index, _, _ in self._scan(_words(text))}
+        return [self.names[index] for index in sorted(found)]
+
+    def spans(self, text):
+        """Return ``(word_count, [(name, start, end)])`` for every term found in ``text``.
+
+        ``start`` and ``end`` are word positions, so callers can tell how
+        much of a message the terms account for.
+        """
+        words = _words(text)
+        return len(words), [(self.names[index], start, end) for index, start, end in self._scan(words)]
+
+    def first(self, text, default=None):
+        """Return the highest-priority intent found in ``text``, or ``default``"""
+        intents = self.match(text)
+        return intents[0] if intents else default
+
+    def _scan(self, words):
+        """Yield ``(intent index, start, end)`` for every term occurrence in ``words``"""
+        root = self._root
+        for start, word in enumerate(words):
+            # Most words start no term: two lookups and on to the next one
+            if word not in root.words and word[:root.stem_length] not in root.stems:
+                continue
+            pending = [(node, start + 1) for node in _advance(root, word)]
+            while pending:
+                node, position = pending.pop()
+                for index in node.intents:
+                    yield index, start, position
+                if position < len(words):
+                    pending.extend((child, position + 1) for child in _advance(node, words[position]))
+
+    def _add(self, words, stem, index):
+        node = self._root
+        for word in words[:-1]:
+            node = node.words.setdefault(word, _Node())
+        last = words[-1]
+        if stem:
+            node = self._stem_node(node, last)
+        else:
+            node = node.words.setdefault(last, _Node())
+        if index not in node.intents:
+            node.intents += (index,)
+
+    @staticmethod
+    def _stem_node(node, stem):
+        for existing, child in node.stems.get(stem[:node.stem_length], ()):
+            if existing == stem:
+                return child
+        child = _Node()
+        entries = [entry for bucket in node.stems.values() for entry in bucket] + [(stem, child)]
+        # Bucket on the shortest stem's length so every stem can be found by its prefix
+        node.stem_length = min(len(existing) for existing, _ in entries)
+        node.stems = {}
+        for entry in entries:
+            node.stems.setdefault(entry[0][:node.stem_length], []).append(entry)
+        return child
@@ -0,0 +1,196 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class InFlightFiles:
+    """Reference counts for files that are currently being sent to a client.
+
+    Janitors and caches never evict a file while it is busy.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def acquire(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            self._counts[path] += 1
+        return path
+
+    def release(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            self._counts[path] -= 1
+            if self._counts[path] <= 0:
+                del self._counts[path]
+
+    def is_busy(self, path):
+        with self._lock:
+            return self._counts.get(os.path.abspath(path), 0) > 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._counts)
+
+
+def send_tracked(response, path, in_flight):
+    """Mark ``path`` busy until the body of a ``send_file`` response has been sent.
+
+    The hold is released through ``call_on_close``. A ``send_file`` body is
+    the server's ``wsgi.file_wrapper``, which werkzeug passes through
+    untouched so the server can sendfile it, but then the response's close
+    hooks never run; the wrapper's own ``close`` runs them instead.
+    Bodiless responses (HEAD, 304) never open the file and are not tracked.
+    """
+    from flask import request
+
+    if request.method == 'HEAD' or response.status_code in (204, 304) or response.response is None:
+        return response
+    held = [in_flight.acquire(path)]
+
+    def release():
+        if held:
+            in_flight.release(held.pop())
+
+    response.call_on_close(release)
+    body = response.response
+    if response.direct_passthrough and hasattr(body, 'close'):
+        close_body = body.close
+
+        def close():
+            try:
+                close_body()
+            finally:
+                release()
+
+        body.close = close
+    return response
+
+
+class AudioJanitor:
+    """Background sweeper that keeps an audio directory within age and size limits.
+
+    Files older than ``max_age`` seconds are removed, then the oldest files are
+    evicted until the directory is under ``max_bytes``. Files that are still
+    being downloaded (per ``in_flight``) are always skipped.
+    """
+
+    def __init__(self, directory, in_flight, max_age=3600, max_bytes=100 * 1024 * 1024, interval=60):
+        self.directory = os.path.abspath(directory)
+        self.in_flight = in_flight
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._files = 0
+        self._bytes = 0
+        self._evicted_age = 0
+        self._evicted_size = 0
+        self._skipped_busy = 0
+        self._sweeps = 0
+        self._last_sweep_ms = 0.0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="kdc-audio-janitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def sweep(self, max_age=None):
+        """Run one eviction pass and return the number of files removed"""
+        max_age = self.max_age if max_age is None else max_age
+        started = time.monotonic()
+        now = time.time()
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        removed_age = removed_size = busy = 0
+        kept = []
+        total = 0
+        for mtime, size, path in files:
+            if now - mtime > max_age:
+                if self.in_flight.is_busy(path):
+                    busy += 1
+                elif self._remove(path):
+                    removed_age += 1
+                    continue
+            kept.append((mtime, size, path))
+            total += size
+
+        if total > self.max_bytes:
+            kept.sort()
+            for mtime, size, path in kept:
+                if total <= self.max_bytes:
+                    break
+                if self.in_flight.is_busy(path):
+                    busy += 1
+                    continue
+                if self._remove(path):
+                    removed_size += 1
+                    total -= size
+
+        with self._lock:
+            self._files = len(files) - removed_age - removed_size
+            self._bytes = total
+            self._evicted_age += removed_age
+            self._evicted_size += removed_size
+            self._skipped_busy += busy
+            self._sweeps += 1
+            self._last_sweep_ms = round((time.monotonic() - started) * 1000, 3)
+        if removed_age or removed_size:
+            logger.info(f"Janitor removed {removed_age} expired and {removed_size} oversize files from {self.directory}")
+        return removed_age + removed_size
+
+    def stats(self):
+        with self._lock:
+            return {
+                'files': self._files,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'max_age_seconds': self.max_age,
+                'evicted_expired': self._evicted_age,
+                'evicted_oversize': self._evicted_size,
+                'skipped_in_flight': self._skipped_busy,
+                'in_flight': len(self.in_flight),
+                'sweeps': self._sweeps,
+                'last_sweep_ms': self._last_sweep_ms,
+            }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Error in audio janitor sweep")
+            self._stop.wait(self.interval)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.error(f"Error removing audio file {path}: {e}")
+            return False
@@ -0,0 +1,114 @@
+import os
+import time
+
+from .audio_jobs import AudioJobs
+from .tts_cache import CLAIM_POLL_SECONDS
+from .tts_backends import split_sentences
+
+
+class Speech:
+    """Chat speech rendered off the request path, served by filename.
+
+    ``schedule`` hands out the content-addressed filename of a reply's audio
+    straight away and renders it on a pool of ``workers`` threads unless it
+    is already in ``bank`` or the TTS cache. Each rendered file gets its
+    viseme track. Audio requests for a file still rendering may wait up to
+    ``wait_seconds`` for it, including files another worker process is
+    rendering into the shared cache.
+    """
+
+    def __init__(self, cache, visemes, voice, lang='en', bank=None, workers=4, wait_seconds=15.0, fallback_dir=None,
+                 mimetype='audio/mpeg'):
+        self.cache = cache
+        self.visemes = visemes
+        self.voice = voice
+        self.lang = lang
+        self.bank = bank
+        self.wait_seconds = wait_seconds
+        self.fallback_dir = fallback_dir
+        self.mimetype = mimetype
+        self.jobs = AudioJobs(self.render, max_workers=workers)
+
+    def render(self, text):
+        """Synthesize (or reuse) the audio for text together with its viseme track"""
+        path = self.cache.get_or_create(text, lang=self.lang, voice=self.voice)
+        self.visemes.ensure(path, text)
+        return path
+
+    def schedule(self, text):
+        """Return the audio filename for text, rendering it in the background if needed"""
+        banked = self.bank.lookup(text) if self.bank is not None else None
+        if banked:
+            self.visemes.ensure(banked, text)
+            return os.path.basename(banked)
+
+        filename = self.cache.filename_for(text, lang=self.lang, voice=self.voice)
+        cached = self.cache.path_for(filename)
+        if cached is None:
+            self.jobs.submit(filename, text)
+        else:
+            self.visemes.ensure(cached, text)
+        return filename
+
+    def schedule_chunks(self, text):
+        """Schedule one audio file per sentence; all render in parallel on the pool"""
+        if self.bank is not None and self.bank.lookup(text):
+            return [self.schedule(text)]
+        sentences = split_sentences(text) or [text]
+        return [self.schedule(sentence) for sentence in sentences]
+
+    def status(self, filename):
+        """Return ``'pending'``, ``'failed'`` or None once the file can be served"""
+        status = self.jobs.status(filename)
+        if status is None and self.cache.pending(filename):
+            # Scheduled by another worker process
+            return 'pending'
+        return status
+
+    def wait(self, filename, timeout):
+        """Block up to ``timeout`` seconds for ``filename``; True once it is finished"""
+        if self.jobs.status(filename) is not None:
+            return self.jobs.wait(filename, timeout)
+        deadline = time.monotonic() + timeout
+        while self.cache.pending(filename):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(CLAIM_POLL_SECONDS)
+        return True
+
+    def wait_time(self, requested=None):
+        """Seconds an audio request may wait for a render, capped at ``wait_seconds``.
+
+        Requests long-poll by default so plain ``<audio>`` elements keep
+        working; ``?wait=0`` answers 202 straight away for clients that poll.
+        """
+        if requested is None:
+            return self.wait_seconds
+        return max(0.0, min(requested, self.wait_seconds))
+
+    def resolve(self, filename):
+        """Return ``(path, content_key, mimetype)``; banked and cached files are content-addressed"""
+        filename = os.path.basename(filename)
+        path = self.bank.path_for(filename) if self.bank is not None else None
+        path = path or self.cache.path_for(filename)
+        if path:
+            return path, os.path.splitext(filename)[0], self.mimetype
+        if self.fallback_dir is None:
+            return None, None, None
+        return os.path.abspath(os.path.join(self.fallback_dir, filename)), None, self.mimetype
+
+    def payload(self, filenames, prefix='', chunked=False):
+        """Describe where the audio for ``filenames`` is served under URL ``prefix``"""
+        payload = {
+            'audio_url': f'{prefix}/audio/{filenames[0]}',
+            'audio_ready': self.status(filenames[0]) is None,
+            # Inline when the audio already exists; otherwise fetch from lipsync_url
+            'lipsync': self.visemes.load(filenames[0]),
+            'lipsync_url': f'{prefix}/lipsync/{filenames[0]}'
+        }
+        if chunked:
+            payload['audio_chunks'] = [f'{prefix}/audio/{filename}' for filename in filenames]
+        return payload
+
+    def stats(self):
+        return self.jobs.stats()
@@ -0,0 +1,95 @@
+import logging
+import os
+import shutil
+import subprocess
+
+from .tts_cache import TTSCache
+
+logger = logging.getLogger(__name__)
+
+
+class AudioProfile:
+    """An output encoding that chat audio can be transcoded to"""
+
+    def __init__(self, name, extension, mimetype, container, codec_args):
+        self.name = name
+        self.extension = extension
+        self.mimetype = mimetype
+        self.container = container
+        self.codec_args = codec_args
+
+
+PROFILES = {
+    'opus24': AudioProfile('opus24', '.opus', 'audio/ogg', 'ogg',
+                           ['-c:a', 'libopus', '-b:a', '24k', '-ac', '1', '-application', 'voip']),
+    'mp3-48': AudioProfile('mp3-48', '.mp3', 'audio/mpeg', 'mp3',
+                           ['-c:a', 'libmp3lame', '-b:a', '48k', '-ac', '1']),
+}
+
+
+class Transcoder:
+    """Produce low-bitrate variants of cached audio with ffmpeg.
+
+    Each profile keeps its own :class:`TTSCache` under ``cache_dir``, keyed by
+    the source file, so a variant is encoded once per distinct reply, shares
+    the single-flight and LRU behaviour of the speech cache, and survives
+    restarts. Without ffmpeg every request is served the original file.
+    """
+
+    def __init__(self, cache_dir, max_bytes=64 * 1024 * 1024, in_flight=None):
+        self.ffmpeg = shutil.which('ffmpeg')
+        self.caches = {}
+        if self.ffmpeg is None:
+            logger.warning("ffmpeg not found; audio profiles are disabled")
+            return
+        for name, profile in PROFILES.items():
+            self.caches[name] = TTSCache(
+                os.path.join(cache_dir, name),
+                self._encoder(profile),
+                max_bytes=max_bytes // len(PROFILES),
+                in_flight=in_flight,
+                extension=profile.extension
+            )
+
+    @property
+    def available(self):
+        return bool(self.caches)
+
+    def negotiate(self, source_path, content_key, mimetype, requested):
+        """Return ``(path, content_key, mimetype)`` for the ``?profile=`` the client asked for.
+
+        The source file is served unless a known profile is explicitly
+        requested; the Accept header is not consulted, since browsers list
+        ``audio/ogg`` by default and would otherwise wait on ffmpeg the
+        first time each reply is played.
+        """
+        variant = self.variant(source_path, requested) if requested else None
+        if variant is None:
+            return source_path, content_key, mimetype
+        return variant + (PROFILES[requested].mimetype,)
+
+    def variant(self, source_path, profile_name):
+        """Return ``(path, content_key)`` of the transcoded file, or None on failure"""
+        cache = self.caches.get(profile_name)
+        if cache is None:
+            return None
+        try:
+            path = cache.get_or_create(os.path.abspath(source_path), lang=profile_name, voice='')
+        except Exception as e:
+            logger.error(f"Error transcoding {source_path} to {profile_name}: {e}")
+            return None
+        return path, os.path.splitext(os.path.basename(path))[0]
+
+    def stats(self):
+        return {name: cache.stats() for name, cache in self.caches.items()}
+
+    def _encoder(self, profile):
+        def encode(source_path, lang, voice, path):
+            subprocess.run(
+                [self.ffmpeg, '-nostdin', '-loglevel', 'error', '-y', '-i', source_path,
+                 *profile.codec_args, '-f', profile.container, path],
+                check=True,
+                capture_output=True,
+                timeout=60
+            )
+        return encode
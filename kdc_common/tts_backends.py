@@ -0,0 +1,158 @@
+import logging
+import re
+import shutil
+import subprocess
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class TTSBackend:
+    """A speech engine that renders text to an audio file.
+
+    ``voice_id`` identifies the engine and voice, and is part of the TTS cache
+    key so switching backends never serves audio from a different engine.
+    """
+
+    name = None
+    extension = '.mp3'
+    mimetype = 'audio/mpeg'
+
+    def __init__(self, voice):
+        self.voice = voice
+
+    @property
+    def voice_id(self):
+        return f"{self.name}/{self.voice}"
+
+    def synthesize(self, text, lang, path):
+        raise NotImplementedError
+
+
+class GTTSBackend(TTSBackend):
+    """Google Translate TTS; needs network access. ``voice`` is the accent (tld)"""
+
+    name = 'gtts'
+
+    def __init__(self, voice='com'):
+        super().__init__(voice)
+
+    def synthesize(self, text, lang, path):
+        from gtts import gTTS
+
+        tts = gTTS(text=text, lang=lang, tld=self.voice, slow=False)
+        tts.save(path)
+
+
+class EspeakBackend(TTSBackend):
+    """Offline synthesis through the espeak-ng (or espeak) command line tool"""
+
+    name = 'espeak'
+    extension = '.wav'
+    mimetype = 'audio/wav'
+
+    def __init__(self, voice=None, speed=160):
+        super().__init__(voice or 'en-us')
+        self.speed = speed
+        self.executable = shutil.which('espeak-ng') or shutil.which('espeak')
+        if self.executable is None:
+            raise RuntimeError("espeak-ng is not installed")
+
+    def synthesize(self, text, lang, path):
+        subprocess.run(
+            [self.executable, '-v', self.voice, '-s', str(self.speed), '-w', path, '--', text],
+            check=True,
+            capture_output=True,
+            timeout=60
+        )
+
+    def phonemes(self, text):
+        """Return the IPA phonemes espeak speaks for ``text``, in order"""
+        result = subprocess.run(
+            # --ipa=3 separates the phonemes of each word with underscores
+            [self.executable, '-q', '-v', self.voice, '--ipa=3', '--', text],
+            check=True,
+            capture_output=True,
+            timeout=10
+        )
+        # Drop language switch markers such as "(fr)"
+        output = _LANGUAGE_SWITCH.sub(' ', result.stdout.decode('utf-8', 'replace'))
+        return [phoneme for word in output.split() for phoneme in word.split('_') if phoneme.strip('ˈˌ')]
+
+
+class Pyttsx3Backend(TTSBackend):
+    """Offline synthesis through pyttsx3 (SAPI5, NSSpeechSynthesizer or espeak)"""
+
+    name = 'pyttsx3'
+    extension = '.wav'
+    mimetype = 'audio/wav'
+
+    # pyttsx3 drives a single native engine that is not thread-safe
+    _engine_lock = threading.Lock()
+
+    def __init__(self, voice=None):
+        super().__init__(voice or 'default')
+
+    def synthesize(self, text, lang, path):
+        import pyttsx3
+
+        with self._engine_lock:
+            engine = pyttsx3.init()
+            if self.voice != 'default':
+                engine.setProperty('voice', self.voice)
+            engine.save_to_file(text, path)
+            engine.runAndWait()
+
+
+_LANGUAGE_SWITCH = re.compile(r'\([^)]*\)')
+
+BACKENDS = {
+    'gtts': GTTSBackend,
+    'espeak': EspeakBackend,
+    'pyttsx3': Pyttsx3Backend,
+}
+
+
+def get_backend(name='gtts', voice=None):
+    """Create the backend called ``name``, falling back to gTTS if it is unavailable"""
+    backend_class = BACKENDS.get((name or 'gtts').lower())
+    if backend_class is None:
+        logger.error(f"Unknown TTS backend '{name}', using gtts")
+        backend_class = GTTSBackend
+    try:
+        return backend_class(voice) if voice else backend_class()
+    except Exception as e:
+        logger.error(f"TTS backend '{name}' is unavailable ({e}), using gtts")
+        return GTTSBackend()
+
+
+def get_phonemizer(backend):
+    """Return espeak's text to phonemes function, or None if espeak is not installed.
+
+    Uses ``backend`` itself when it is the espeak backend, so the phonemes
+    match the voice that speaks them.
+    """
+    if isinstance(backend, EspeakBackend):
+        return backend.phonemes
+    try:
+        return EspeakBackend().phonemes
+    except RuntimeError:
+        return None
+
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def split_sentences(text, min_length=20):
+    """Split a reply into sentences, merging fragments shorter than ``min_length``"""
+    chunks = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        if not sentence:
+            continue
+        if chunks and len(chunks[-1]) < min_length:
+            chunks[-1] = f"{chunks[-1]} {sentence}"
+        else:
+            chunks.append(sentence)
+    if len(chunks) > 1 and len(chunks[-1]) < min_length:
+        chunks[-2] = f"{chunks[-2]} {chunks.pop()}"
+    return chunks
@@ -0,0 +1,255 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXTENSION = ".mp3"
+
+# How often a process waiting on another process's synthesis checks the disk
+CLAIM_POLL_SECONDS = 0.1
+
+
+class _Flight:
+    """A synthesis in progress that concurrent callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+class TTSCache:
+    """On-disk, content-addressed cache of synthesized speech.
+
+    Files are named by a hash of ``(text, lang, voice)`` so identical replies
+    map to the same file across restarts. Recency is tracked through file
+    mtimes, which lets the LRU order survive a restart; once the cache grows
+    past ``max_bytes`` the least recently used files are evicted. Concurrent
+    misses for the same key collapse into a single call to ``synthesize``.
+    Files reported busy by ``in_flight`` are never evicted mid-download.
+
+    Several processes may share ``cache_dir``. A file another process wrote
+    is adopted the first time it is asked for, and a ``<key>.lock`` file
+    claims a synthesis so the other processes wait for it instead of
+    repeating it. Claims older than ``claim_ttl`` seconds are considered
+    abandoned.
+    """
+
+    def __init__(self, cache_dir, synthesize, max_bytes=256 * 1024 * 1024, in_flight=None,
+                 extension=DEFAULT_EXTENSION, claim_ttl=120):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.extension = extension
+        self.synthesize = synthesize
+        self.max_bytes = int(max_bytes)
+        self.in_flight = in_flight
+        self.claim_ttl = claim_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._flights = {}
+        self._hits = 0
+        self._misses = 0
+        self._collapsed = 0
+        self._evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def key_for(text, lang='en', voice='default'):
+        """Return the content address for a piece of speech"""
+        payload = json.dumps([text, lang, voice], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def filename_for(self, text, lang='en', voice='default'):
+        return self.key_for(text, lang, voice) + self.extension
+
+    def path_for(self, filename):
+        """Return the on-disk path of a cached file, or None if it is not cached"""
+        key, ext = os.path.splitext(os.path.basename(filename))
+        if ext != self.extension:
+            return None
+        with self._lock:
+            known = key in self._entries
+        if not known and not self._adopt(key):
+            return None
+        return os.path.join(self.cache_dir, key + self.extension)
+
+    def pending(self, filename):
+        """Return True while some process holds the claim to synthesize ``filename``"""
+        key, ext = os.path.splitext(os.path.basename(filename))
+        return ext == self.extension and self._is_claimed(key)
+
+    def get_or_create(self, text, lang='en', voice='default'):
+        """Return the path of the audio for ``text``, synthesizing it on a miss"""
+        key = self.key_for(text, lang, voice)
+        path = os.path.join(self.cache_dir, key + self.extension)
+
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    hit = True
+                else:
+                    hit = False
+                    flight = self._flights.get(key)
+                    leader = flight is None
+                    if leader:
+                        flight = self._flights[key] = _Flight()
+                        self._misses += 1
+                    else:
+                        self._collapsed += 1
+
+            if hit:
+                if self._touch(path):
+                    return path
+                # The file was removed behind our back; synthesize it again
+                with self._lock:
+                    size = self._entries.pop(key, None)
+                    if size is not None:
+                        self._total_bytes -= size
+                continue
+
+            if leader:
+                break
+
+            # Another request is already synthesizing this text
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+
+        try:
+            while not self._adopt(key):
+                if self._claim(key):
+                    try:
+                        self._synthesize_to(text, lang, voice, path)
+                    finally:
+                        self._release(key)
+                else:
+                    # Another process is synthesizing this text
+                    time.sleep(CLAIM_POLL_SECONDS)
+            self._evict()
+            return path
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'collapsed': self._collapsed,
+                'evictions': self._evictions,
+            }
+
+    def _synthesize_to(self, text, lang, voice, path):
+        # Write to a private file first so readers never see a partial mp3
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            self.synthesize(text, lang, voice, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _adopt(self, key):
+        """Index the file for ``key`` if it is on disk, e.g. written by another process"""
+        try:
+            size = os.path.getsize(os.path.join(self.cache_dir, key + self.extension))
+        except OSError:
+            return False
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = size
+                self._total_bytes += size
+        return True
+
+    def _claim(self, key):
+        """Take the cross-process claim on synthesizing ``key``; False if another process holds it"""
+        lock_path = os.path.join(self.cache_dir, key + '.lock')
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            pass
+        if not self._is_claimed(key):
+            # Abandoned by a process that died mid-synthesis; claim it on the next try
+            self._release(key)
+        return False
+
+    def _release(self, key):
+        try:
+            os.remove(os.path.join(self.cache_dir, key + '.lock'))
+        except FileNotFoundError:
+            pass
+
+    def _is_claimed(self, key):
+        try:
+            claimed_at = os.path.getmtime(os.path.join(self.cache_dir, key + '.lock'))
+        except OSError:
+            return False
+        return time.time() - claimed_at < self.claim_ttl
+
+    def _load_index(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(('.tmp', '.lock')):
+                # Left behind by an interrupted synthesis, unless another process is still on it
+                try:
+                    if time.time() - os.path.getmtime(path) >= self.claim_ttl:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            if not name.endswith(self.extension) or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name[:-len(self.extension)], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+        logger.info(f"Loaded {len(self._entries)} cached audio files ({self._total_bytes} bytes)")
+        self._evict()
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                if self._total_bytes <= self.max_bytes or len(self._entries) <= 1:
+                    return
+                key = next((k for k in self._entries if not self._is_busy(k)), None)
+                if key is None:
+                    return
+                size = self._entries.pop(key)
+                self._total_bytes -= size
+                self._evictions += 1
+            try:
+                os.remove(os.path.join(self.cache_dir, key + self.extension))
+            except FileNotFoundError:
+                pass
+
+    def _is_busy(self, key):
+        if self.in_flight is None:
+            return False
+        return self.in_flight.is_busy(os.path.join(self.cache_dir, key + self.extension))
+
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
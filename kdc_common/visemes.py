@@ -0,0 +1,204 @@
+import json
+import logging
+import os
+import re
+import uuid
+import wave
+
+logger = logging.getLogger(__name__)
+
+# Rhubarb Lip Sync mouth shapes, the format the avatar frontend already plays:
+# A closed (P B M), B slightly open (most consonants, EE), C open (EH AE),
+# D wide open (AA), E rounded (AO ER), F puckered (UW OW W), G F/V,
+# H tongue up (L), X idle
+_DIGRAPHS = {
+    'th': 'B', 'sh': 'B', 'ch': 'B', 'ng': 'B', 'ph': 'G', 'wh': 'F', 'qu': 'F',
+    'oo': 'F', 'ou': 'F', 'ow': 'F', 'ee': 'B', 'ea': 'B', 'ai': 'C', 'ay': 'C',
+    'oi': 'E', 'oy': 'E', 'er': 'E', 'ar': 'D',
+}
+_LETTERS = {
+    'a': 'D', 'e': 'C', 'i': 'B', 'o': 'E', 'u': 'F', 'y': 'B',
+    'b': 'A', 'm': 'A', 'p': 'A', 'f': 'G', 'v': 'G', 'l': 'H', 'w': 'F', 'r': 'E',
+}
+_VOWELS = set('aeiouy')
+# The same shapes for espeak's IPA phonemes; other consonants are B
+_PHONEMES = {
+    'p': 'A', 'b': 'A', 'm': 'A', 'f': 'G', 'v': 'G', 'l': 'H', 'ɫ': 'H', 'w': 'F',
+    'i': 'B', 'ɪ': 'B', 'ᵻ': 'B', 'j': 'B',
+    'e': 'C', 'ɛ': 'C', 'eɪ': 'C', 'æ': 'C', 'ʌ': 'C', 'ə': 'C', 'ɐ': 'C',
+    'a': 'D', 'ɑ': 'D', 'aɪ': 'D', 'aʊ': 'D',
+    'ɔ': 'E', 'ɒ': 'E', 'ɔɪ': 'E', 'ɜ': 'E', 'ɚ': 'E', 'ɝ': 'E', 'ɹ': 'E', 'r': 'E',
+    'o': 'F', 'oʊ': 'F', 'əʊ': 'F', 'u': 'F', 'ʊ': 'F',
+}
+_IPA_VOWELS = set('aeiouæɐɑɒɔəɚɛɜɝɪʊʌᵻ')
+_IPA_LONG = 'ː'
+_TOKEN = re.compile(r"[a-z']+|[,;:]|[.!?]+")
+
+# Relative time given to each kind of sound
+_VOWEL_WEIGHT = 1.0
+_CONSONANT_WEIGHT = 0.6
+_PAUSE_WEIGHT = {',': 2.0, ';': 2.0, ':': 2.0}
+_STOP_WEIGHT = 3.5
+_LONG_WEIGHT = 1.5
+
+# gTTS and espeak both leave a short silence before and after speech
+_LEAD_IN = 0.08
+_TAIL = 0.12
+
+_MP3_BITRATES = {
+    'mpeg1': [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    'mpeg2': [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+# Average speaking rate, used only when the audio length cannot be read
+_CHARS_PER_SECOND = 14.0
+
+
+def audio_duration(path):
+    """Return the length of a WAV or CBR MP3 file in seconds, or None"""
+    try:
+        if path.endswith('.wav'):
+            with wave.open(path, 'rb') as f:
+                return f.getnframes() / float(f.getframerate())
+        return _mp3_duration(path)
+    except Exception as e:
+        logger.error(f"Error reading audio duration for {path}: {e}")
+        return None
+
+
+def _mp3_duration(path):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(10)
+        offset = 0
+        if head[:3] == b'ID3':
+            # ID3v2 tag size is a 28-bit syncsafe integer
+            offset = 10 + ((head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9])
+        f.seek(offset)
+        data = f.read(4096)
+    for i in range(len(data) - 3):
+        if data[i] == 0xFF and (data[i + 1] & 0xE0) == 0xE0:
+            version = (data[i + 1] >> 3) & 0x03
+            bitrate_index = data[i + 2] >> 4
+            table = _MP3_BITRATES['mpeg1' if version == 3 else 'mpeg2']
+            if 0 < bitrate_index < 15:
+                return (size - offset - i) * 8 / (table[bitrate_index] * 1000.0)
+    return None
+
+
+def _units(word):
+    i = 0
+    while i < len(word):
+        pair = word[i:i + 2]
+        if pair in _DIGRAPHS:
+            yield _DIGRAPHS[pair], _VOWEL_WEIGHT if pair[0] in _VOWELS else _CONSONANT_WEIGHT
+            i += 2
+            continue
+        letter = word[i]
+        if letter.isalpha():
+            weight = _VOWEL_WEIGHT if letter in _VOWELS else _CONSONANT_WEIGHT
+            yield _LETTERS.get(letter, 'B'), weight
+        i += 1
+
+
+def _phoneme_unit(phoneme):
+    phoneme = phoneme.strip('ˈˌ')
+    base = phoneme.replace(_IPA_LONG, '')
+    weight = _VOWEL_WEIGHT if base[:1] in _IPA_VOWELS else _CONSONANT_WEIGHT
+    if _IPA_LONG in phoneme:
+        weight *= _LONG_WEIGHT
+    return _PHONEMES.get(base, _PHONEMES.get(base[:1], 'B')), weight
+
+
+def _clause_units(words, phonemize):
+    if phonemize is not None:
+        try:
+            return [_phoneme_unit(phoneme) for phoneme in phonemize(' '.join(words))]
+        except Exception as e:
+            logger.error(f"Error reading phonemes, using the spelling instead: {e}")
+    return [unit for word in words for unit in _units(word)]
+
+
+def text_to_visemes(text, duration=None, phonemize=None):
+    """Build a Rhubarb-style mouth cue timeline for ``text`` spoken over ``duration`` seconds.
+
+    ``phonemize`` turns a clause into IPA phonemes (see
+    ``tts_backends.get_phonemizer``); without it the mouth shapes are
+    guessed from the spelling.
+    """
+    shapes = []
+    words = []
+    for token in _TOKEN.findall(text.lower()):
+        if token[0] in '.!?' or token in _PAUSE_WEIGHT:
+            shapes.extend(_clause_units(words, phonemize))
+            words = []
+            shapes.append(('X', _STOP_WEIGHT if token[0] in '.!?' else _PAUSE_WEIGHT[token]))
+        else:
+            words.append(token)
+    shapes.extend(_clause_units(words, phonemize))
+
+    if duration is None:
+        duration = _LEAD_IN + len(text) / _CHARS_PER_SECOND + _TAIL
+    duration = round(duration, 2)
+
+    total = sum(weight for _, weight in shapes)
+    speech = max(0.0, duration - _LEAD_IN - _TAIL)
+    cues = [{'start': 0.0, 'end': _LEAD_IN, 'value': 'X'}]
+    position = _LEAD_IN
+    for value, weight in shapes:
+        end = position + (speech * weight / total if total else 0.0)
+        if cues[-1]['value'] == value:
+            cues[-1]['end'] = end
+        else:
+            cues.append({'start': position, 'end': end, 'value': value})
+        position = end
+    if cues[-1]['value'] == 'X':
+        cues[-1]['end'] = duration
+    else:
+        cues.append({'start': position, 'end': duration, 'value': 'X'})
+
+    for cue in cues:
+        cue['start'] = round(cue['start'], 2)
+        cue['end'] = round(cue['end'], 2)
+    return {
+        'metadata': {'duration': duration},
+        'mouthCues': [cue for cue in cues if cue['end'] > cue['start']],
+    }
+
+
+class VisemeTracks:
+    """Viseme timelines stored as ``<audio key>.json`` next to the audio cache.
+
+    A track is computed once per audio file, right after synthesis, so chat
+    responses can include it without the browser analysing the audio.
+    Mouth shapes follow the phonemes from ``phonemize`` when it is given.
+    """
+
+    def __init__(self, directory, phonemize=None):
+        self.directory = os.path.abspath(directory)
+        self.phonemize = phonemize
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, audio_filename):
+        key = os.path.splitext(os.path.basename(audio_filename))[0]
+        return os.path.join(self.directory, key + '.json')
+
+    def ensure(self, audio_path, text):
+        """Compute and store the track for ``audio_path`` unless it already exists"""
+        path = self.path_for(audio_path)
+        if os.path.exists(path):
+            return path
+        track = text_to_visemes(text, audio_duration(audio_path), self.phonemize)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(track, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        return path
+
+    def load(self, audio_filename):
+        """Return the stored track for an audio file, or None if there is none yet"""
+        try:
+            with open(self.path_for(audio_filename), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None